@@ -0,0 +1,44 @@
+# Times the analytics engine on synthetic readings: summarize() on in-memory arrays of increasing
+# size (the vectorized statistics alone), then Analytics.get on a synthetic database, cold (loading
+# the readings from sqlite) and memoized.
+# Run from the repository root:  python benchmarks/analytics.py [readings ...]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+from synthetic import make_db
+
+from classes.analytics import summarize
+from classes.data_manager import DataManager
+
+def synthetic_readings(n, seed=0):
+    rng = np.random.RandomState(seed)
+    timestamps = np.arange(n) * 300
+    bg = 140 + 60 * np.sin(timestamps * (4 * np.pi / 86400)) + rng.normal(0, 20, n)
+    return timestamps, np.clip(bg, 40, 400).astype(np.int32)
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for n in sizes:
+        timestamps, bg = synthetic_readings(n)
+        start = time.time()
+        result = summarize(timestamps, bg)
+        print("%8d readings: summarize in %6.1f ms (TIR %.0f%%, GMI %.1f%%, CV %.0f%%, MAGE %.0f)"
+              % (n, 1e3 * (time.time() - start), 100 * result['time_in_range']['in range'], result['gmi'],
+                 result['cv'], result['mage']))
+    directory = tempfile.mkdtemp()
+    try:
+        n = min(sizes[-1], 200000)
+        dm = DataManager(make_db(n, directory))
+        analytics = dm.get_analytics()
+        for label in ('cold', 'memoized'):
+            start = time.time()
+            analytics.get(None, None)
+            print("%8d entries in sqlite: Analytics.get %s in %6.1f ms" % (n, label, 1e3 * (time.time() - start)))
+        dm.close()
+    finally:
+        shutil.rmtree(directory)
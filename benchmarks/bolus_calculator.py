@@ -0,0 +1,39 @@
+# Times the bolus calculator against synthetic logs of increasing size: the current insulin and carbs
+# on board (which should not grow with the log), a day of IOB/COB at 5 minute steps, and fitting
+# carb ratio and correction factor to the whole log.
+# Run from the repository root:  python benchmarks/bolus_calculator.py [rows ...]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+from synthetic import make_db
+
+from classes.data_manager import DataManager
+from classes.bolus_calculator import BolusCalculator
+
+def timed(function, repeats=1):
+    start = time.time()
+    for i in range(repeats):
+        result = function()
+    return (time.time() - start) / repeats, result
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000]
+    directory = tempfile.mkdtemp()
+    try:
+        for n in sizes:
+            dm = DataManager(make_db(n, directory))
+            calculator = BolusCalculator(dm)
+            now = dm.con.execute("SELECT MAX(Timestamp) FROM Data").fetchone()[0]
+            board, (iob, cob) = timed(lambda: calculator.on_board(now), 100)
+            day, series = timed(lambda: calculator.on_board_series(np.arange(now - 86400, now, 300)))
+            fit, ratios = timed(calculator.fit_ratios)
+            print("%8d entries: on board %.2f ms (IOB %.1f U, COB %.0f g), day series %.1f ms, fit %.0f ms over %d windows"
+                  % (n, 1e3 * board, iob, cob, 1e3 * day, 1e3 * fit, ratios['events']))
+            dm.close()
+    finally:
+        shutil.rmtree(directory)
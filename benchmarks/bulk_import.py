@@ -0,0 +1,58 @@
+# Measures write throughput in rows per second: single new_entry calls (one commit each), a batched
+# new_entries call, and a CSV bulk import through classes.data_import.
+# Run from the repository root:  python benchmarks/bulk_import.py [rows]
+import os
+import sys
+import csv
+import time
+import tempfile
+
+from synthetic import synthetic_entries
+
+from classes.data_manager import DataManager
+from classes.data_import import import_file
+
+# Returns the path of a new, empty database file
+def empty_db():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.remove(path)
+    return path
+
+def report(name, rows, seconds):
+    print("%-28s %8d rows %8.2fs %10.0f rows/s" % (name, rows, seconds, rows / seconds))
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    single_n = min(n, 2000)
+
+    path = empty_db()
+    dm = DataManager(path)
+    start = time.time()
+    for entry in synthetic_entries(single_n):
+        dm.new_entry(*entry)
+    report("new_entry (commit per row)", single_n, time.time() - start)
+    dm.close()
+    os.remove(path)
+
+    path = empty_db()
+    dm = DataManager(path)
+    start = time.time()
+    dm.new_entries(synthetic_entries(n))
+    report("new_entries (one batch)", n, time.time() - start)
+    dm.close()
+    os.remove(path)
+
+    fd, csv_path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(fd, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Glucose', 'Carbs', 'Insulin', 'Notes'])
+        writer.writerows(synthetic_entries(n))
+    path = empty_db()
+    dm = DataManager(path)
+    start = time.time()
+    imported = import_file(dm, csv_path)
+    report("CSV import", imported, time.time() - start)
+    dm.close()
+    os.remove(path)
+    os.remove(csv_path)
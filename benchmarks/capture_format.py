@@ -0,0 +1,46 @@
+# Compares the size and load time of the text traces in trials/ with the same traces converted to the
+# binary capture format.  Loading a capture memory maps it, so the benchmark also sums the samples to
+# make sure the data is actually read.
+# Run from the repository root:  python benchmarks/capture_format.py [repeats]
+import os
+import sys
+import glob
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from classes.adc_backends import load_trace
+from classes.capture import convert_trace, open_capture, EXTENSION
+
+def bench_load(paths, load, repeats):
+    start = time.time()
+    for i in range(repeats):
+        for path in paths:
+            times, values = load(path)
+            int(values.sum())
+    return (time.time() - start) / repeats
+
+def load_capture(path):
+    capture = open_capture(path)
+    return capture.times, capture.values
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    traces = sorted(glob.glob('trials/*.txt'))
+    directory = tempfile.mkdtemp()
+    try:
+        captures = []
+        for path in traces:
+            out_path = os.path.join(directory, os.path.splitext(os.path.basename(path))[0] + EXTENSION)
+            convert_trace(path, out_path)
+            captures.append(out_path)
+        text_size = sum(os.path.getsize(path) for path in traces)
+        capture_size = sum(os.path.getsize(path) for path in captures)
+        print("%d traces: text %d bytes, binary %d bytes (%.1fx smaller)" % (len(traces), text_size, capture_size, float(text_size) / capture_size))
+        text_time = bench_load(traces, load_trace, repeats)
+        capture_time = bench_load(captures, load_capture, repeats)
+        print("load all: text %.1f ms, binary %.2f ms (%.0fx faster)" % (1e3 * text_time, 1e3 * capture_time, text_time / capture_time))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,56 @@
+# Exports a synthetic log (1M entries by default) in each format and reports the time, rows per
+# second and file size, then the peak memory allocated by a second, traced run of each export, which
+# should stay flat however big the log is.  Finishes with an incremental export after a few new
+# entries.  Tracing needs Python 3; on Python 2 only the times are reported.
+# Run from the repository root:  python benchmarks/export.py [rows]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from synthetic import make_db, synthetic_entries
+
+from classes.data_manager import DataManager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+FORMATS = (('csv', '.csv'), ('jsonl', '.jsonl'), ('binary', '.bin'))
+
+def report(name, rows, seconds, path, peak=None):
+    line = "%-12s %8d rows %7.2fs %10.0f rows/s %8.1f MB" % (name, rows, seconds, rows / max(seconds, 1e-9),
+                                                             os.path.getsize(path) / 1e6)
+    if peak is not None:
+        line += ", peak %.1f MB allocated" % (peak / 1e6)
+    print(line)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    directory = tempfile.mkdtemp()
+    try:
+        dm = DataManager(make_db(n, directory))
+        for fmt, extension in FORMATS:
+            out = os.path.join(directory, 'export' + extension)
+            start = time.time()
+            rows = dm.export(out, fmt)
+            elapsed = time.time() - start
+            peak = None
+            if tracemalloc is not None:
+                tracemalloc.start()
+                dm.export(out, fmt)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            report(fmt, rows, elapsed, out, peak)
+
+        out = os.path.join(directory, 'incremental.csv')
+        dm.export(out, since='benchmark')
+        dm.new_entries(synthetic_entries(100, seed=1))
+        start = time.time()
+        rows = dm.export(out, since='benchmark')
+        report('incremental', rows, time.time() - start, out)
+        dm.close()
+    finally:
+        shutil.rmtree(directory)
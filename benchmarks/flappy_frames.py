@@ -0,0 +1,51 @@
+# Runs the FlappyBird game loop without drawing and reports how long each frame's update takes
+# (median, 99th percentile and worst) and how many garbage collections ran meanwhile.  The bird is
+# flapped every half second and crashes are counted instead of ending the game.
+# Run from the repository root:  python benchmarks/flappy_frames.py [frames]
+import os
+import sys
+import gc
+import time
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kivy.lang import Builder
+from kivy.clock import Clock
+
+from classes.FlappyBird import FlappyBirdGame, STEP
+
+FLAP_INTERVAL = 30
+
+class HeadlessGame(FlappyBirdGame):
+    crashes = 0
+
+    def game_over(self):
+        self.crashes += 1
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    Builder.load_file(os.path.join('classes', 'flappybird.kv'))
+    game = HeadlessGame(size=(800, 600))
+    collections = gc.get_count()[0] if not hasattr(gc, 'get_stats') else sum(s['collections'] for s in gc.get_stats())
+    times = []
+    for frame in range(frames):
+        if frame % FLAP_INTERVAL == 0:
+            game.mcnay.on_touch_down(None)
+        elif frame % FLAP_INTERVAL == FLAP_INTERVAL // 2:
+            game.mcnay.stop_jumping(0)
+        start = time.time()
+        game.update(STEP)
+        times.append(time.time() - start)
+    Clock.unschedule(game.mcnay.switch_to_normal)
+    collections = (sum(s['collections'] for s in gc.get_stats()) - collections) if hasattr(gc, 'get_stats') else None
+    print("%d frames: update p50 %.3f ms, p99 %.3f ms, max %.3f ms; score %d, %d crashes; %s garbage collections"
+          % (frames, 1e3 * percentile(times, 0.5), 1e3 * percentile(times, 0.99), 1e3 * max(times),
+             game.score, game.crashes, 'unknown' if collections is None else collections))
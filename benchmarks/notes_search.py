@@ -0,0 +1,46 @@
+# Times DataManager.search_notes against a synthetic log (100k entries by default) for queries as
+# they are typed, ranked and newest first, over the whole log and over its last week, and with the
+# LIKE scan used when sqlite has no FTS5 for comparison.  Synthetic notes are one of four words, so
+# every prefix matches a quarter of the log, which is the worst case for ranking.
+# Run from the repository root:  python benchmarks/notes_search.py [rows]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from synthetic import make_db
+
+from classes.data_manager import DataManager
+
+DAY = 24*60*60
+QUERIES = ('p', 'pi', 'pizz', 'pizza', 'exercise', 'snack pizza')
+
+def best_of(function, repeats=5):
+    best = None
+    for i in range(repeats):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp()
+    try:
+        dm = DataManager(make_db(n, directory))
+        end = dm.con.execute("SELECT MAX(Timestamp) FROM Data").fetchone()[0]
+        week = end - 7 * DAY
+        print("%-12s %10s %10s %10s %10s" % ('query', 'ranked', 'newest', 'week', 'LIKE'))
+        for query in QUERIES:
+            ranked, rows = best_of(lambda: dm.search_notes(query))
+            newest, rows = best_of(lambda: dm.search_notes(query, order='newest'))
+            recent, rows = best_of(lambda: dm.search_notes(query, week, end, order='newest'))
+            notes_index, dm.notes_index = dm.notes_index, False
+            like, rows = best_of(lambda: dm.search_notes(query, order='newest'))
+            dm.notes_index = notes_index
+            print("%-12s %8.1fms %8.1fms %8.1fms %8.1fms" % (query, 1e3 * ranked, 1e3 * newest, 1e3 * recent, 1e3 * like))
+        dm.close()
+    finally:
+        shutil.rmtree(directory)
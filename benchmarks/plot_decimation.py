@@ -0,0 +1,41 @@
+# Times the min/max per pixel decimation HomeScreen uses for its graph on a year of synthetic
+# 5 minute readings, and checks the decimated line keeps every column's extremes.
+# Run from the repository root:  python benchmarks/plot_decimation.py [graph width in pixels]
+import os
+import sys
+import time
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from classes.plotting import decimate
+
+DAY = 24*60*60
+
+def year_of_readings(seed=0):
+    rng = np.random.RandomState(seed)
+    timestamps = np.arange(0, 365 * DAY, 5 * 60)
+    days = timestamps / float(DAY)
+    bg = 120 + 40 * np.sin(days * 2 * np.pi) + rng.normal(0, 15, len(days))
+    return days, np.clip(bg, 40, 400)
+
+if __name__ == "__main__":
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+    x, y = year_of_readings()
+    repeats = 20
+    start = time.time()
+    for i in range(repeats):
+        dx, dy = decimate(x, y, 0, 365, width)
+    elapsed = (time.time() - start) / repeats
+    points = time.time()
+    list(zip(x.tolist(), y.tolist()))
+    points = time.time() - points
+    print("%d readings -> %d points for %d pixels in %.1f ms (building the undecimated point list alone takes %.1f ms)"
+          % (len(x), len(dx), width, 1e3 * elapsed, 1e3 * points))
+    column = (x * width / 365.0).astype(int)
+    assert np.array_equal(np.unique(column), np.unique((dx * width / 365.0).astype(int)))
+    assert dy.max() == y.max() and dy.min() == y.min()
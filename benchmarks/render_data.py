@@ -0,0 +1,39 @@
+# Times DataScreen.render_data against synthetic logs.  render_data only builds the RecycleView data
+# from the shared DataManager, so this measures the cost of loading the log rather than of creating
+# widgets.
+# Run from the repository root:  python benchmarks/render_data.py [rows ...]
+import os
+import sys
+import time
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+from synthetic import make_db
+
+from classes import data_manager
+from classes.data_screen import DataScreen
+
+# Renders the log in path onto screen once and returns the elapsed seconds
+def time_render(screen, path):
+    data_manager._shared_manager = screen.dm = data_manager.DataManager(path)
+    screen.ids.rv.data = []
+    start = time.time()
+    screen.render_data()
+    elapsed = time.time() - start
+    screen.dm.close()
+    return elapsed
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    empty = make_db(0)
+    data_manager.DB_PATH = empty
+    screen = DataScreen(name='data')
+    os.remove(empty)
+    for n in sizes:
+        path = make_db(n)
+        try:
+            elapsed = time_render(screen, path)
+        finally:
+            os.remove(path)
+        print("%7d rows: render_data %.3fs, %d rows in the view" % (n, elapsed, len(screen.ids.rv.data)))
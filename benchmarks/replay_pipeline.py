@@ -0,0 +1,60 @@
+# Load tests the acquisition pipeline without hardware by replaying the recorded traces in trials/.
+# Reports how fast traces can be streamed, and the sample rate, dropped samples and CPU use of an
+# AcquisitionThread sampling a ReplayADC at accelerated speed.
+# Run from the repository root:  python benchmarks/replay_pipeline.py [trace] [sample rate] [speed]
+import os
+import sys
+import glob
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from classes.adc_backends import ReplayADC
+from classes.acquisition import AcquisitionThread, RingBuffer
+
+# Returns user + system CPU seconds used by this process
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+# Streams every trace at full speed and reports samples per second
+def bench_streaming(paths):
+    samples = 0
+    start = time.time()
+    for path in paths:
+        adc = ReplayADC(path, speed=0)
+        for times, values in adc.iter_blocks():
+            samples += len(values)
+        adc.close()
+    elapsed = time.time() - start
+    print("streamed %d traces, %d samples in %.2fs (%.0f samples/s)" % (len(paths), samples, elapsed, samples / elapsed))
+
+# Samples a replayed trace through an AcquisitionThread for duration seconds while a consumer drains it
+def bench_acquisition(path, sample_rate, speed, duration=5.0):
+    adc = ReplayADC(path, speed=speed, loop=True)
+    buffer = RingBuffer()
+    thread = AcquisitionThread(adc, buffer, sample_rate=sample_rate)
+    consumed = 0
+    cpu = cpu_time()
+    start = time.time()
+    thread.start()
+    while time.time() - start < duration:
+        times, values = buffer.read()
+        consumed += len(values)
+        time.sleep(0.05)
+    thread.stop()
+    thread.join()
+    consumed += len(buffer.read()[1])
+    elapsed = time.time() - start
+    cpu = cpu_time() - cpu
+    print("%s at %.0fx: asked for %d samples/s, got %.1f samples/s, %d dropped, %.1f%% of a core"
+          % (os.path.basename(path), speed, sample_rate, consumed / elapsed, buffer.dropped, 100 * cpu / elapsed))
+    adc.close()
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else 'trials/trial24.txt'
+    sample_rate = int(sys.argv[2]) if len(sys.argv) > 2 else 860
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else 100
+    bench_streaming(sorted(glob.glob('trials/*.txt')))
+    bench_acquisition(path, 10, 1)
+    bench_acquisition(path, sample_rate, speed)
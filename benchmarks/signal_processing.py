@@ -0,0 +1,93 @@
+# Measures the streaming strip and sample detection on the recorded traces in trials/.  For each trace
+# it compares raw single sample threshold crossings (what adc_poller used to trigger on) with the
+# median filtered, debounced detections, reports how much later the debounced detection fires than the
+# first raw crossing, and the CPU time spent per sample by the filter and detectors.
+# Run from the repository root:  python benchmarks/signal_processing.py [block size]
+import os
+import sys
+import glob
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from classes.adc_backends import ReplayADC
+from classes.signal_processing import median_filter, Debouncer
+from classes.blood_glucose_tester import STRIP_INSERT_THRESHOLD, SAMPLE_INSERT_THRESHOLD, FILTER_WINDOW, DEBOUNCE_SAMPLES
+
+# Returns user + system CPU seconds used by this process
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+# Returns the times at which values rise above threshold from at or below it
+def raw_crossings(times, values, threshold):
+    above = values > threshold
+    rising = np.flatnonzero(above[1:] & ~above[:-1]) + 1
+    if len(above) and above[0]:
+        rising = np.concatenate(([0], rising))
+    return times[rising]
+
+# Runs the filter and rising and falling debouncers for threshold over blocks, returning the times of
+# each debounced rising detection
+def detect(blocks, threshold):
+    rising = Debouncer(threshold, DEBOUNCE_SAMPLES)
+    falling = Debouncer(threshold, DEBOUNCE_SAMPLES, above=False)
+    detector = rising
+    detections = []
+    for times, values in median_filter(blocks, FILTER_WINDOW):
+        start = 0
+        while start < len(values):
+            found = detector.find(values[start:])
+            if found is None:
+                break
+            start += found
+            if detector is rising:
+                detections.append(times[start])
+            detector = falling if detector is rising else rising
+            detector.reset()
+            start += 1
+    return detections
+
+def bench_trace(path, block_size):
+    adc = ReplayADC(path, speed=0)
+    blocks = list(adc.iter_blocks(block_size))
+    adc.close()
+    if not blocks:
+        return None
+    times = np.concatenate([block[0] for block in blocks])
+    values = np.concatenate([block[1] for block in blocks])
+    results = []
+    cpu = cpu_time()
+    for threshold in (STRIP_INSERT_THRESHOLD, SAMPLE_INSERT_THRESHOLD):
+        results.append((raw_crossings(times, values, threshold), detect(iter(blocks), threshold)))
+    cpu = cpu_time() - cpu
+    return len(values), cpu, results
+
+def latencies(raw, detections):
+    delays = []
+    for detected in detections:
+        before = raw[raw <= detected]
+        if len(before):
+            delays.append(detected - before[-1])
+    return delays
+
+if __name__ == "__main__":
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    total_samples = 0
+    total_cpu = 0.0
+    delays = []
+    print("%-16s %8s %19s %20s" % ("trace", "samples", "strip raw/debounced", "sample raw/debounced"))
+    for path in sorted(glob.glob('trials/*.txt')):
+        result = bench_trace(path, block_size)
+        if result is None:
+            continue
+        samples, cpu, ((strip_raw, strip), (sample_raw, sample)) = result
+        total_samples += samples
+        total_cpu += cpu
+        delays += latencies(strip_raw, strip) + latencies(sample_raw, sample)
+        print("%-16s %8d %10d/%-8d %10d/%-8d" % (os.path.basename(path), samples, len(strip_raw), len(strip),
+                                                 len(sample_raw), len(sample)))
+    print("%d samples, %.2f us CPU per sample with blocks of %d" % (total_samples, 1e6 * total_cpu / max(total_samples, 1), block_size))
+    if delays:
+        print("detection latency after the last raw crossing: median %.3fs, max %.3fs" % (np.median(delays), np.max(delays)))
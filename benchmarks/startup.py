@@ -0,0 +1,50 @@
+# Measures startup: runs main.py and reports the time from launch to the first frame the window
+# draws, then how long each of the other screens takes to build on its first visit.  With --profile
+# the startup is run under cProfile and the slowest calls up to the first frame are listed.
+# Run from the repository root:  python benchmarks/startup.py [--profile]
+import os
+import sys
+import time
+
+start = time.time()
+
+import runpy
+import cProfile
+import pstats
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kivy.app import App
+from kivy.core.window import Window
+
+profiler = cProfile.Profile() if '--profile' in sys.argv else None
+
+# Called after every frame is drawn; the first call ends the measurement
+def first_frame(*args):
+    Window.unbind(on_flip=first_frame)
+    elapsed = time.time() - start
+    if profiler is not None:
+        profiler.disable()
+    print("time to first frame: %.0f ms" % (1e3 * elapsed))
+    app = App.get_running_app()
+    sm = app.root.ids.sm
+    for name in ['home'] + app.screen_ids:
+        if sm.loaded_screen(name) is not None:
+            print("  %-10s built at startup" % name)
+            continue
+        built = time.time()
+        sm.load_screen(name)
+        print("  %-10s built on first visit in %.0f ms" % (name, 1e3 * (time.time() - built)))
+    app.stop()
+
+Window.bind(on_flip=first_frame)
+if profiler is not None:
+    profiler.enable()
+try:
+    runpy.run_path('main.py', run_name='__main__')
+finally:
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
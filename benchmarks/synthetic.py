@@ -0,0 +1,29 @@
+# Helpers for building synthetic glucose logs for the benchmarks in this directory
+import os
+import sys
+import random
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from classes.data_manager import DataManager
+
+# Yields n plausible (date, bg, carbs, bolus, notes) entries, one every five minutes ending now
+def synthetic_entries(n, seed=0):
+    rand = random.Random(seed)
+    start = datetime.datetime.now() - datetime.timedelta(minutes=5 * n)
+    for i in range(n):
+        date = start + datetime.timedelta(minutes=5 * i)
+        carbs = rand.choice((0, 0, 0, 0, 15, 30, 45, 60))
+        yield (date.strftime('%Y-%m-%d %H:%M'), rand.randint(60, 250), carbs, carbs // 10, rand.choice((' ', 'pizza', 'exercise', 'snack')))
+
+# Creates a fresh database file holding n synthetic entries and returns its path
+def make_db(n, directory=None):
+    fd, path = tempfile.mkstemp(suffix='.db', dir=directory)
+    os.close(fd)
+    os.remove(path)
+    dm = DataManager(path)
+    dm.new_entries(synthetic_entries(n))
+    dm.close()
+    return path
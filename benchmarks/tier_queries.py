@@ -0,0 +1,42 @@
+# Times a five year graph query (800 pixels wide) against synthetic logs of increasing size, reading
+# the BgTiers aggregates with get_bg_series and, for comparison, every raw reading with get_range_array.
+# The tiered query should take about the same time whatever the number of entries.
+# Run from the repository root:  python benchmarks/tier_queries.py [rows ...]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from synthetic import make_db
+
+from classes.data_manager import DataManager
+
+DAY = 24*60*60
+WIDTH = 800
+
+def best_of(function, repeats=5):
+    best = None
+    for i in range(repeats):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000]
+    directory = tempfile.mkdtemp()
+    try:
+        for n in sizes:
+            dm = DataManager(make_db(n, directory))
+            end = dm.con.execute("SELECT MAX(Timestamp) FROM Data").fetchone()[0]
+            start = end - 5 * 365 * DAY
+            resolution = float(end - start) / WIDTH
+            tiered, (tier, buckets) = best_of(lambda: dm.get_bg_series(start, end, resolution))
+            raw, rows = best_of(lambda: dm.get_range_array(start, end, ('Timestamp', 'Bg')))
+            print("%8d entries: tier %6ds, %5d buckets in %6.1f ms; raw %7d rows in %7.1f ms"
+                  % (n, tier, len(buckets), 1e3 * tiered, len(rows), 1e3 * raw))
+            dm.close()
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,66 @@
+# Times single entry writes in each storage mode, the way the UI and the meter write them, while
+# another connection keeps reading the database like a second process would.  Reports how long
+# new_entry blocks the caller (median, 99th percentile and worst) and the longest the reader was
+# held up.  /tmp is often in memory, where fsync costs nothing; pass --dir to run on the SD card.
+# Run from the repository root:  python benchmarks/write_latency.py [--dir path] [writes]
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import sqlite3 as lite
+
+from synthetic import make_db, synthetic_entries
+
+from classes.data_manager import DataManager, STORAGE_MODES
+
+ROWS = 10000
+WRITE_INTERVAL = 0.01
+
+# Runs a query on its own connection until stopped, returning the slowest query in seconds
+def reader(path, stopped, slowest):
+    con = lite.connect(path, timeout=30)
+    while not stopped.is_set():
+        start = time.time()
+        con.execute("SELECT COUNT(*), AVG(Bg) FROM Data WHERE Timestamp > 0").fetchone()
+        slowest[0] = max(slowest[0], time.time() - start)
+        time.sleep(0.001)
+    con.close()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    directory = None
+    if args[:1] == ['--dir']:
+        directory = args[1]
+        args = args[2:]
+    writes = int(args[0]) if args else 500
+    directory = tempfile.mkdtemp(dir=directory)
+    try:
+        for mode in sorted(STORAGE_MODES):
+            path = make_db(ROWS, directory)
+            dm = DataManager(path, mode)
+            stopped = threading.Event()
+            slowest = [0.0]
+            thread = threading.Thread(target=reader, args=(path, stopped, slowest))
+            thread.start()
+            latencies = []
+            begin = time.time()
+            for date, bg, carbs, bolus, notes in synthetic_entries(writes, seed=1):
+                start = time.time()
+                dm.new_entry(date, bg, carbs, bolus, notes)
+                latencies.append(time.time() - start)
+                time.sleep(WRITE_INTERVAL)
+            dm.close()
+            total = time.time() - begin
+            stopped.set()
+            thread.join()
+            print("%-9s new_entry p50 %6.2f ms, p99 %6.2f ms, max %6.2f ms; slowest read %6.2f ms; %d writes in %.1f s"
+                  % (mode, 1e3 * percentile(latencies, 0.5), 1e3 * percentile(latencies, 0.99),
+                     1e3 * max(latencies), 1e3 * slowest[0], writes, total))
+    finally:
+        shutil.rmtree(directory)
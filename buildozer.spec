@@ -26,6 +26,8 @@ source.include_exts = py,png,jpg,kv,atlas,db
 
 # (list) List of exclusions using pattern matching
 #source.exclude_patterns = license,images/*/*.jpg
+# the FlappyBird sprites ship packed in res/atlas/flappy (see classes/sprites.py)
+source.exclude_patterns = res/images/*
 
 # (str) Application versioning (method 1)
 version = 0.1
@@ -6,13 +6,19 @@ import sys
 
 from kivy.properties import NumericProperty, ReferenceListProperty, BooleanProperty, ObjectProperty, ListProperty
 from kivy.uix.image import Image
-from kivy.vector import Vector
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.config import Config
-from kivy.core.window import Window
 from kivy.uix.widget import Widget
 
+from . import sprites
+
+STEP = 1.0 / 60.0           # seconds per game step; velocities are in pixels per step
+MAX_STEPS = 5               # most steps run for one frame
+OBSTACLE_POOL_SIZE = 4      # more than can be on screen at once
+OBSTACLE_VELOCITY = -3
+GROUND = 104
+
 class Background(Widget):
     image_one = ObjectProperty(Image())
     image_two = ObjectProperty(Image())
@@ -22,8 +28,8 @@ class Background(Widget):
     velocity = ReferenceListProperty(velocity_x, velocity_y)
 
     def update(self):
-        self.image_one.pos = Vector(*self.velocity) + self.image_one.pos
-        self.image_two.pos = Vector(*self.velocity) + self.image_two.pos
+        self.image_one.x += self.velocity_x
+        self.image_two.x += self.velocity_x
 
         if self.image_one.right <= 0:
             self.image_one.pos = (self.width, 0)
@@ -54,6 +60,8 @@ class Mcnay(Widget):
     def __init__(self, **kwargs):
         super(Mcnay, self).__init__(**kwargs)
         if Config.getdefault('input', 'keyboard', False):
+            # only imported here so the game can run without a window (see benchmarks/flappy_frames.py)
+            from kivy.core.window import Window
             self._keyboard = Window.request_keyboard(
                 self._keyboard_closed, self, 'text')
             self._keyboard.bind(on_key_down=self._on_keyboard_down)
@@ -62,18 +70,22 @@ class Mcnay(Widget):
         self._keyboard.unbind(on_key_down=self._on_keyboard_down)
         self._keyboard = None
 
+    # Shows one of the bird's frames, a region of the preloaded sprite atlas
+    def show_frame(self, frame):
+        self.bird_image.texture = sprites.texture(sprites.FLAPPY_ATLAS, frame)
+
     def switch_to_normal(self, dt):
-        self.bird_image.source = "res/images/flappyup.png"
+        self.show_frame('flappyup')
         Clock.schedule_once(self.stop_jumping, self.jump_time  * (4.0 / 5.0))
 
     def stop_jumping(self, dt):
         self.jumping = False
-        self.bird_image.source = "res/images/flappy.png"
+        self.show_frame('flappy')
         self.velocity_y = self.normal_velocity_y
 
     def on_touch_down(self, touch):
         self.jumping = True
-        self.bird_image.source = "res/images/flappynormal.png"
+        self.show_frame('flappynormal')
         self.velocity_y = self.jump_height / (self.jump_time * 60.0)
         Clock.unschedule(self.stop_jumping)
         Clock.schedule_once(self.switch_to_normal, self.jump_time  / 5.0)
@@ -82,12 +94,16 @@ class Mcnay(Widget):
         self.on_touch_down(None)
 
     def update(self):
-        self.pos = Vector(*self.velocity) + self.pos
-        if self.pos[1] <= 104:
+        self.x += self.velocity_x
+        self.y += self.velocity_y
+        if self.y <= GROUND:
             Clock.unschedule(self.stop_jumping)
-            self.bird_image.source = "res/images/flappynormal.png"
-            self.pos = (self.pos[0], 104)
+            self.show_frame('flappynormal')
+            self.y = GROUND
 
+# An obstacle is a pipe from the top of the screen and one from the ground with a gap between them.
+# FlappyBirdGame keeps a fixed pool of them and recycles each one when it leaves the screen, so no
+# widgets are created or dropped while the game runs.
 class Obstacle(Widget):
     gap_top = NumericProperty(0)
     gap_size = NumericProperty(150)
@@ -100,12 +116,37 @@ class Obstacle(Widget):
 
     def __init__(self, **kwargs):
         super(Obstacle, self).__init__(**kwargs)
+        self.active = False
+        self.upper_bottom = 0  # bottom of the upper pipe
+        self.lower_top = 0     # top of the lower pipe
 
     def update_position(self):
         self.gap_top = randint(self.gap_size + 112, self.height)
+        self.upper_bottom = self.gap_top + 20
+        self.lower_top = self.gap_top - self.gap_size
+
+    # Brings the obstacle in at x with a new gap
+    def activate(self, x, velocity_x):
+        self.active = True
+        self.marked = False
+        self.x = x
+        self.velocity_x = velocity_x
+        self.update_position()
+
+    # Parks the obstacle off screen until it is needed again
+    def deactivate(self):
+        self.active = False
+        self.velocity_x = 0
+        self.x = -2 * self.width
 
     def update(self):
-        self.pos = Vector(*self.velocity) + self.pos
+        self.x += self.velocity_x
+
+    # Whether the rectangle at (x, y) of size (w, h) touches either pipe, like collide_widget would
+    def collides(self, x, y, w, h):
+        if x + w < self.x or x > self.x + self.width:
+            return False
+        return (y + h >= self.upper_bottom and y <= self.height + 20) or (y <= self.lower_top and y + h >= 0)
 
 class FlappyBirdGame(Widget):
     mcnay = ObjectProperty(Mcnay())
@@ -118,59 +159,77 @@ class FlappyBirdGame(Widget):
         self.mcnay.normal_velocity = [0, -4]
         self.mcnay.velocity = self.mcnay.normal_velocity
         self.background.velocity = [-2, 0]
+        self.time_left = 0.0
+        self.obstacles = [Obstacle() for i in range(OBSTACLE_POOL_SIZE)]
+        for obstacle in self.obstacles:
+            obstacle.height = self.height
+            obstacle.deactivate()
+            self.add_widget(obstacle)
         self.bind(size=self.size_callback)
 
-    def remove_obstacle(self):
-        self.remove_widget(self.obstacles[0])
-        self.obstacles = self.obstacles[1:]
-
-    def new_obstacle(self, remove=True):
-        if remove:
-            self.remove_obstacle()
-        new_obstacle = Obstacle()
-        new_obstacle.height = self.height
-        new_obstacle.x = self.width
-        new_obstacle.update_position()
-        new_obstacle.velocity = [-3, 0]
-        self.add_widget(new_obstacle)
-        self.obstacles = self.obstacles + [new_obstacle]
+    # Brings in the next obstacle from the pool at the right edge.  If they are all on screen, the
+    # one furthest left is reused.
+    def new_obstacle(self):
+        free = None
+        for obstacle in self.obstacles:
+            if not obstacle.active:
+                free = obstacle
+                break
+            if free is None or obstacle.x < free.x:
+                free = obstacle
+        free.activate(self.width, OBSTACLE_VELOCITY)
 
     def size_callback(self, instance, value):
         for obstacle in self.obstacles:
             obstacle.height = value[1]
-            obstacle.update_position()
+            if obstacle.active:
+                obstacle.update_position()
         self.background.size = value
         self.background.update_position()
 
+    # Advances the game by dt seconds in fixed steps of STEP seconds, carrying the remainder over to
+    # the next frame, so the game runs at the same speed whatever the frame rate.  After a long stall
+    # at most MAX_STEPS steps are run rather than trying to catch up.
     def update(self, dt):
-        self.mcnay.update()
+        self.time_left = min(self.time_left + dt, MAX_STEPS * STEP)
+        while self.time_left >= STEP:
+            self.time_left -= STEP
+            self.step()
+
+    # Moves everything one step on and checks for collisions
+    def step(self):
+        mcnay = self.mcnay
+        mcnay.update()
         self.background.update()
-        # Loop through and update obstacles. Replace obstacles which went off the screen.
+        x, y, w, h = mcnay.x, mcnay.y, mcnay.width, mcnay.height
+        any_active = False
         for obstacle in self.obstacles:
+            if not obstacle.active:
+                continue
+            any_active = True
             obstacle.update()
-            if obstacle.x < self.mcnay.x and not obstacle.marked:
+            if obstacle.right < 0:
+                obstacle.deactivate()
+                continue
+            if not obstacle.marked and obstacle.x < x:
                 obstacle.marked = True
                 self.score += 1
-                self.new_obstacle(remove=False)
-        if len(self.obstacles) == 0:
-            self.new_obstacle(remove=False)
-        elif self.obstacles[0].x < 0:
-            self.remove_obstacle()
-        # If obstacles is emply
-        # See if the player collides with any obstacles
-        for obstacle in self.obstacles:
-            if self.mcnay.collide_widget(Widget(pos=(obstacle.x, obstacle.gap_top + 20), size=(obstacle.width, obstacle.height - obstacle.gap_top))):
-                # This will be replaced later on
-                sys.exit()
-            if self.mcnay.collide_widget(Widget(pos=(obstacle.x, 0), size=(obstacle.width, obstacle.gap_top - obstacle.gap_size))):
-                # This will also be replaced
-                sys.exit()
+                self.new_obstacle()
+            if obstacle.collides(x, y, w, h):
+                self.game_over()
+        if not any_active:
+            self.new_obstacle()
+
+    def game_over(self):
+        # This will be replaced later on
+        sys.exit()
 
 class FlappyBirdApp(App):
 
     def build(self):
+        sprites.preload(sprites.FLAPPY_ATLAS)
         game = FlappyBirdGame()
-        Clock.schedule_interval(game.update, 1.0/60.0)
+        Clock.schedule_interval(game.update, STEP)
         return game
 
 if __name__ == "__main__":
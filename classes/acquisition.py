@@ -0,0 +1,137 @@
+# Rate controlled ADC acquisition.  An AcquisitionThread samples the ADC at a fixed rate, sleeping
+# between samples (or waiting on the ADS1115 ALERT/RDY pin when one is wired up) instead of spinning
+# on the I2C bus, and hands samples to consumers through a single producer, single consumer RingBuffer.
+
+import time
+import threading
+
+import numpy as np
+
+# Output data rates the ADS1115 supports in continuous mode, in samples per second
+ADS1115_DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+DEFAULT_SAMPLE_RATE = 10
+DEFAULT_BUFFER_SIZE = 4096
+
+# time.monotonic doesn't exist on python 2
+clock = getattr(time, 'monotonic', time.time)
+
+# Fixed size buffer of (time, value) samples shared by one producer thread and one consumer.  The
+# producer only ever writes self.head and the consumer only ever writes self.tail, so neither side
+# takes a lock.  When the consumer falls behind, new samples are dropped and counted rather than
+# overwriting ones it may be reading.
+class RingBuffer:
+
+    def __init__(self, size=DEFAULT_BUFFER_SIZE):
+        self.size = size
+        self.times = np.zeros(size)
+        self.values = np.zeros(size, dtype=np.int32)
+        self.head = 0  # total samples written
+        self.tail = 0  # total samples read
+        self.dropped = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    # Adds a sample.  Returns False if the buffer was full and the sample was dropped.
+    def push(self, timestamp, value):
+        head = self.head
+        if head - self.tail >= self.size:
+            self.dropped += 1
+            return False
+        index = head % self.size
+        self.times[index] = timestamp
+        self.values[index] = value
+        self.head = head + 1  # publish only after the sample is written
+        return True
+
+    # Removes and returns up to limit samples as (times, values) arrays, oldest first
+    def read(self, limit=None):
+        tail = self.tail
+        count = self.head - tail
+        if limit is not None:
+            count = min(count, limit)
+        indices = np.arange(tail, tail + count) % self.size
+        times, values = self.times[indices], self.values[indices]
+        self.tail = tail + count
+        return times, values
+
+    # Yields (times, values) blocks of at most block_size samples as they arrive, checking every
+    # poll_interval seconds, until stopped (a threading.Event) is set
+    def iter_blocks(self, block_size, stopped, poll_interval=0.05):
+        while not stopped.is_set():
+            times, values = self.read(block_size)
+            if len(values):
+                yield times, values
+            else:
+                stopped.wait(poll_interval)
+
+# Samples one ADC channel at sample_rate and pushes the readings into buffer until stopped.  The adc
+# needs read_adc_difference(differential, gain=...) like Adafruit_ADS1x15.ADS1115.  If it also has
+# start_adc_difference and get_last_result the ADC is put in continuous conversion mode, and if
+# data_ready is given (an Event set from a GPIO edge callback on ALERT/RDY) each sample is taken as
+# soon as a conversion completes instead of on a timer.
+class AcquisitionThread(threading.Thread):
+
+    def __init__(self, adc, buffer, sample_rate=DEFAULT_SAMPLE_RATE, differential=3, gain=1, data_ready=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.adc = adc
+        self.buffer = buffer
+        self.sample_rate = sample_rate
+        self.differential = differential
+        self.gain = gain
+        self.data_ready = data_ready
+        self.stopped = threading.Event()
+        self.continuous = hasattr(adc, 'start_adc_difference') and hasattr(adc, 'get_last_result')
+
+    # Slowest ADS1115 data rate that still keeps up with the requested sample rate
+    def data_rate(self):
+        for rate in ADS1115_DATA_RATES:
+            if rate >= self.sample_rate:
+                return rate
+        return ADS1115_DATA_RATES[-1]
+
+    def stop(self):
+        self.stopped.set()
+        if self.data_ready is not None:
+            self.data_ready.set()  # wake the thread if it is waiting for a conversion
+
+    def run(self):
+        if self.continuous:
+            self.adc.start_adc_difference(self.differential, gain=self.gain, data_rate=self.data_rate())
+        try:
+            if self.data_ready is not None:
+                self.run_on_ready()
+            else:
+                self.run_timed()
+        finally:
+            if self.continuous and hasattr(self.adc, 'stop_adc'):
+                self.adc.stop_adc()
+
+    def read(self):
+        if self.continuous:
+            return self.adc.get_last_result()
+        return self.adc.read_adc_difference(self.differential, gain=self.gain)
+
+    # Takes a sample every 1/sample_rate seconds.  Deadlines are absolute so timing errors don't
+    # accumulate, and waiting on the stop event means stop() takes effect immediately.
+    def run_timed(self):
+        period = 1.0 / self.sample_rate
+        deadline = clock()
+        while not self.stopped.is_set():
+            now = clock()
+            self.buffer.push(now, self.read())
+            deadline += period
+            if deadline < now:
+                deadline = now + period  # fell behind (e.g. a slow I2C read); skip rather than burst
+            self.stopped.wait(deadline - now)
+
+    # Takes a sample each time the ALERT/RDY pin signals a finished conversion
+    def run_on_ready(self):
+        while not self.stopped.is_set():
+            if not self.data_ready.wait(1.0):
+                continue
+            self.data_ready.clear()
+            if self.stopped.is_set():
+                break
+            self.buffer.push(clock(), self.read())
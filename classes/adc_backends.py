@@ -0,0 +1,162 @@
+# ADC backends for BloodGlucoseTester.  The real meter uses an Adafruit ADS1115; ReplayADC stands in
+# for it by streaming a recorded trace from trials/ at real time or accelerated speed, so the strip
+# detection and reading pipeline can run and be load tested on any machine.
+# The backend is picked with the GLUCOMETER_ADC environment variable: unset or "ads1115" for the real
+# ADC, or "replay:trials/trial24.txt" (optionally "...@10" for ten times real time, "@0" for as fast
+# as it can be read).
+
+import os
+import mmap
+import time
+
+import numpy as np
+
+# time.monotonic doesn't exist on python 2
+clock = getattr(time, 'monotonic', time.time)
+
+# Loads a trials/*.txt trace ('#' comment lines, then "time value" pairs) as (times, values) arrays
+def load_trace(path):
+    data = np.loadtxt(path, comments='#', ndmin=2)
+    return data[:, 0], data[:, 1].astype(np.int32)
+
+# Interface every ADC backend provides.  Backends that can convert continuously also implement
+# start_adc_difference, get_last_result and stop_adc like Adafruit_ADS1x15.ADS1115.
+class ADCBackend(object):
+
+    # Returns one reading of the given differential channel pair
+    def read_adc_difference(self, differential, gain=1):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+# The real ADS1115 on the I2C bus
+class ADS1115Backend(ADCBackend):
+
+    def __init__(self, device=None):
+        if device is None:
+            import Adafruit_ADS1x15
+            device = Adafruit_ADS1x15.ADS1115()
+        self.device = device
+
+    def read_adc_difference(self, differential, gain=1):
+        return self.device.read_adc_difference(differential, gain=gain)
+
+    def start_adc_difference(self, differential, gain=1, data_rate=None):
+        return self.device.start_adc_difference(differential, gain=gain, data_rate=data_rate)
+
+    def get_last_result(self):
+        return self.device.get_last_result()
+
+    def stop_adc(self):
+        self.device.stop_adc()
+
+# Simulated ADC that streams a recorded trace.  The file is memory mapped and parsed a line at a time,
+# so even the largest traces start instantly and use no memory beyond the page cache.  With speed 1
+# each read returns the sample recorded at the time elapsed since the first read; higher speeds play
+# the trace faster, and speed 0 returns the next sample on every read regardless of time.  At the
+# end of the trace the last value is held, or playback restarts if loop is set.
+class ReplayADC(ADCBackend):
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.started = None
+        self.rewind()
+
+    # Goes back to the start of the trace
+    def rewind(self):
+        self.map.seek(0)
+        self.started = None
+        first = self.next_sample()
+        self.finished = first is None
+        self.current = first if first is not None else (0.0, 0)
+        self.pending = self.next_sample() if first is not None else None
+        self.offset = self.current[0]
+
+    # Parses the next "time value" line, skipping comments.  Returns None at the end of the file.
+    def next_sample(self):
+        while True:
+            line = self.map.readline()
+            if not line:
+                return None
+            if line.startswith(b'#'):
+                continue
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            return float(fields[0]), int(float(fields[1]))
+
+    # Yields every (time, value) sample of the trace, ignoring speed.  Playback restarts from the
+    # beginning afterwards.
+    def iter_samples(self):
+        self.map.seek(0)
+        sample = self.next_sample()
+        while sample is not None:
+            yield sample
+            sample = self.next_sample()
+        self.rewind()
+
+    # Yields the trace as (times, values) arrays of up to block_size samples
+    def iter_blocks(self, block_size=1024):
+        times = np.empty(block_size)
+        values = np.empty(block_size, dtype=np.int32)
+        count = 0
+        for timestamp, value in self.iter_samples():
+            times[count] = timestamp
+            values[count] = value
+            count += 1
+            if count == block_size:
+                yield times.copy(), values.copy()
+                count = 0
+        if count:
+            yield times[:count].copy(), values[:count].copy()
+
+    # Moves through the trace up to trace time target and returns the sample in effect then
+    def advance(self, target):
+        while self.pending is not None and self.pending[0] <= target:
+            self.current = self.pending
+            self.pending = self.next_sample()
+        if self.pending is None:
+            self.finished = True
+        return self.current[1]
+
+    def read_adc_difference(self, differential, gain=1):
+        if self.finished and self.loop:
+            self.rewind()
+        if self.speed == 0:
+            value = self.current[1]
+            if self.pending is not None:
+                self.current = self.pending
+                self.pending = self.next_sample()
+            else:
+                self.finished = True
+            return value
+        now = clock()
+        if self.started is None:
+            self.started = now
+        return self.advance(self.offset + (now - self.started) * self.speed)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+# Returns the backend named by spec (or the GLUCOMETER_ADC environment variable), or None when the
+# real ADC was asked for but isn't available
+def open_backend(spec=None):
+    if spec is None:
+        spec = os.environ.get('GLUCOMETER_ADC', 'ads1115')
+    if spec.startswith('replay:'):
+        path = spec[len('replay:'):]
+        speed = 1.0
+        if '@' in path:
+            path, speed = path.rsplit('@', 1)
+            speed = float(speed)
+        return ReplayADC(path, speed=speed)
+    try:
+        return ADS1115Backend()
+    except Exception:
+        return None
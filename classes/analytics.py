@@ -0,0 +1,172 @@
+# Glucose analytics over any date range: time in range, glucose management indicator (GMI),
+# coefficient of variation, mean amplitude of glycemic excursions (MAGE) and percentiles of the
+# daily pattern.  Every statistic is computed with vectorized NumPy over the range's readings, and
+# Analytics memoizes the results per range until the next write to the database.
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DAY = 24*60*60
+
+# Time in range bands in mg/dL, as (name, lowest reading, lowest reading of the next band), following
+# the international consensus targets
+RANGE_BANDS = (
+    ('very low', 0, 54),
+    ('low', 54, 70),
+    ('in range', 70, 181),
+    ('high', 181, 251),
+    ('very high', 251, None),
+)
+PERCENTILES = (5, 25, 50, 75, 95)
+PATTERN_BIN_MINUTES = 60
+CACHE_SIZE = 16
+
+# Returns the fraction of readings in each of RANGE_BANDS, keyed by band name
+def time_in_range(bg):
+    bg = np.asarray(bg)
+    edges = [low for name, low, high in RANGE_BANDS[1:]]
+    counts = np.bincount(np.searchsorted(edges, bg, side='right'), minlength=len(RANGE_BANDS))
+    total = float(max(len(bg), 1))
+    return dict((band[0], counts[i] / total) for i, band in enumerate(RANGE_BANDS))
+
+# Glucose management indicator, the HbA1c (in %) the mean reading in mg/dL corresponds to
+def gmi(mean):
+    return 3.31 + 0.02392 * mean
+
+# Standard deviation as a percentage of the mean
+def coefficient_of_variation(bg):
+    bg = np.asarray(bg, dtype=float)
+    mean = bg.mean() if len(bg) else 0.0
+    return 100 * bg.std() / mean if mean else 0.0
+
+# Splits readings into days, returning the index of each day's first reading and each day's
+# reading count.  timestamps must be sorted.
+def split_days(timestamps):
+    day = np.asarray(timestamps) // DAY
+    starts = np.flatnonzero(np.concatenate(([True], day[1:] != day[:-1]))) if len(day) else np.zeros(0, dtype=np.int64)
+    return starts, np.diff(np.append(starts, len(day)))
+
+# Mean amplitude of glycemic excursions: the mean size of the rises and falls between a peak and a
+# nadir that are larger than one standard deviation of that day's readings, over every day in the
+# range.  Each day is scanned for turning points with a hysteresis of one standard deviation, and
+# all days are scanned together, so the Python loop runs once per reading of the busiest day rather
+# than once per reading.
+def mage(timestamps, bg):
+    bg = np.asarray(bg, dtype=float)
+    starts, counts = split_days(timestamps)
+    if not len(counts):
+        return 0.0
+    sums = np.add.reduceat(bg, starts)
+    squares = np.add.reduceat(bg * bg, starts)
+    sd = np.sqrt(np.maximum(squares / counts - (sums / counts) ** 2, 0))
+    direction = np.zeros(len(counts))   # +1 rising, -1 falling, 0 until the first excursion
+    turn = bg[starts].copy()            # last confirmed peak or nadir
+    extreme = bg[starts].copy()         # highest (rising) or lowest (falling) reading since then
+    low = bg[starts].copy()             # lowest and highest readings before the first excursion
+    high = bg[starts].copy()
+    total = np.zeros(len(counts))
+    excursions = np.zeros(len(counts))
+    for column in range(1, counts.max()):
+        days = np.flatnonzero(counts > column)
+        value = bg[starts[days] + column]
+        d = direction[days]
+        day_sd = sd[days]
+        # before the first excursion, wait for the readings to move one deviation from a low or high
+        starting = d == 0
+        rise = starting & (value - low[days] >= day_sd) & (day_sd > 0)
+        fall = starting & (high[days] - value >= day_sd) & (day_sd > 0) & ~rise
+        turn[days[rise]] = low[days[rise]]
+        turn[days[fall]] = high[days[fall]]
+        low[days] = np.minimum(low[days], value)
+        high[days] = np.maximum(high[days], value)
+        d = np.where(rise, 1, np.where(fall, -1, d))
+        # after that, a reversal of one deviation from the extreme confirms it as a turning point
+        ext = extreme[days]
+        reverse = ~starting & (d * (ext - value) >= day_sd)
+        total[days[reverse]] += np.abs(ext - turn[days])[reverse]
+        excursions[days[reverse]] += 1
+        turn[days[reverse]] = ext[reverse]
+        d = np.where(reverse, -d, d)
+        extend = ~starting & ~reverse & (d * (value - ext) > 0)
+        extreme[days] = np.where(starting | reverse | extend, value, ext)
+        direction[days] = d
+    # the excursion in progress at the end of each day counts if it is already big enough
+    last = np.abs(extreme - turn)
+    finished = (direction != 0) & (last >= sd)
+    total += np.where(finished, last, 0)
+    excursions += finished
+    return float(total.sum() / excursions.sum()) if excursions.sum() else 0.0
+
+# Percentiles of the readings by time of day, in bins of bin_minutes.  Returns a (bins,
+# len(percentiles)) array, with nan for bins without readings.
+def daily_percentiles(timestamps, bg, percentiles=PERCENTILES, bin_minutes=PATTERN_BIN_MINUTES):
+    bins = DAY // (bin_minutes * 60)
+    time_bin = (np.asarray(timestamps) % DAY) // (bin_minutes * 60)
+    counts = np.bincount(time_bin, minlength=bins)
+    # sort by bin then reading, so each bin is a sorted run and percentiles are index arithmetic.  One
+    # sort of bin * span + reading does both at once, much faster than lexsort.
+    values = np.asarray(bg, dtype=float)
+    lowest = values.min() if len(values) else 0.0
+    span = values.max() - lowest + 1 if len(values) else 1.0
+    values = np.sort(time_bin * span + (values - lowest)) - np.repeat(np.arange(bins) * span, counts) + lowest
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = np.full((bins, len(percentiles)), np.nan)
+    filled = counts > 0
+    for i, percentile in enumerate(percentiles):
+        # linear interpolation between the closest ranks, like np.percentile
+        position = starts[filled] + (counts[filled] - 1) * (percentile / 100.0)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, starts[filled] + counts[filled] - 1)
+        fraction = position - below
+        result[filled, i] = values[below] * (1 - fraction) + values[above] * fraction
+    return result
+
+# Computes every statistic for the readings (timestamps sorted, zero readings already removed)
+def summarize(timestamps, bg):
+    bg = np.asarray(bg, dtype=float)
+    mean = bg.mean() if len(bg) else 0.0
+    return {
+        'readings': len(bg),
+        'mean': mean,
+        'std': bg.std() if len(bg) else 0.0,
+        'gmi': gmi(mean) if len(bg) else 0.0,
+        'cv': coefficient_of_variation(bg),
+        'time_in_range': time_in_range(bg),
+        'mage': mage(timestamps, bg),
+        'daily_percentiles': daily_percentiles(timestamps, bg),
+    }
+
+# Memoized analytics over a DataManager's readings.  Results are cached per (start, end) range and
+# the whole cache is dropped as soon as anything is written to the database.
+class Analytics:
+
+    def __init__(self, dm, cache_size=CACHE_SIZE):
+        self.dm = dm
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+
+    # Returns the summarize() statistics of the readings from start to end (inclusive, None for no bound)
+    def get(self, start, end):
+        key = (start, end)
+        version = self.dm.data_version()
+        with self.lock:
+            if version != self.version:
+                self.cache.clear()
+                self.version = version
+            elif key in self.cache:
+                result = self.cache.pop(key)
+                self.cache[key] = result  # most recently used last
+                return result
+        rows = self.dm.get_range_array(start, end, ('Timestamp', 'Bg'))
+        readings = rows['Bg'] != 0  # zero means no reading was taken
+        result = summarize(rows['Timestamp'][readings], rows['Bg'][readings])
+        with self.lock:
+            if version == self.version:
+                self.cache[key] = result
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return result
@@ -6,34 +6,81 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.dropdown import DropDown
 from kivy.uix.popup import Popup
-from .data_manager import DataManager
-from .blood_glucose_tester import BloodGlucoseTester
+from .data_manager import get_data_manager
+from .blood_glucose_tester import (BloodGlucoseTester, STRIP_INSERTED, SAMPLE_APPLIED, PROGRESS, READING_DONE,
+                                   STRIP_REMOVED)
 from kivy.lang import Builder
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 Builder.load_file('kvfiles/bg_screen.kv')
 
+# The measurement runs on its own threads and reports back through a queue, which is drained on the
+# UI thread this often.  Handling an event is only a property change or opening a popup, and at most
+# EVENTS_PER_FRAME are handled per call, so a measurement never holds up a frame.
+EVENT_INTERVAL = 1 / 30.
+EVENTS_PER_FRAME = 16
+
 class BGScreen(Screen):
     def __init__(self, **kwargs):
         super(BGScreen, self).__init__(**kwargs)
+        self.popup = None
         self.bgt = BloodGlucoseTester(self)
+        Clock.schedule_interval(self.process_events, EVENT_INTERVAL)
+
     def open_popup(self):
-        popup = BGPopup(self.bgt)
-        popup.open()
+        if self.popup is None:
+            self.popup = BGPopup(self.bgt)
+            self.popup.bind(on_dismiss=self.popup_dismissed)
+            self.popup.open()
+
+    def popup_dismissed(self, popup):
+        if popup is self.popup:
+            self.popup = None
+
+    # Handles the events the tester has posted since the last call
+    def process_events(self, dt):
+        for i in range(EVENTS_PER_FRAME):
+            try:
+                event, value = self.bgt.events.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_event(event, value)
+
+    def handle_event(self, event, value):
+        if event == STRIP_INSERTED:
+            self.open_popup()
+        elif self.popup is None:
+            return
+        elif event == SAMPLE_APPLIED:
+            self.popup.reading_started()
+        elif event == PROGRESS:
+            self.popup.set_progress(value)
+        elif event == READING_DONE:
+            self.popup.display_BG('%d' % round(value))
+        elif event == STRIP_REMOVED and not self.popup.done:
+            self.popup.dismiss()
 
 class BGPopup(Popup):
     def __init__(self, bgtester, **kwargs):
         super(BGPopup, self).__init__(**kwargs)
         self.bgt = bgtester
+        self.done = False
+
+    def reading_started(self):
+        self.ids.status.text = 'Reading...'
+        self.ids.pb.value = 0
+
+    # Shows how far through the reading delay the measurement is, fraction from 0 to 1
+    def set_progress(self, fraction):
+        self.ids.pb.value = 100 * fraction
 
-    def start_pb(self):
-        event = Clock.schedule_interval(self.update_pb, 1 / 60.)
-    def update_pb(self, dt):
-        self.ids.pb.value = self.ids.pb.value + (1/3.)
-        if self.ids.pb.value >= 100:
-            self.display_BG('106')
-            self.ids.pb.value = 0
-            return False
     def display_BG(self, value):
+        self.done = True
+        self.ids.pb.value = 100
+        self.ids.status.text = 'Remove strip'
         popup = Popup(title='BG',
         content=Label(text=value,font_size=25),
         size_hint=(None, None), size=(125, 125))
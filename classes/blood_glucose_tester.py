@@ -2,15 +2,47 @@
 import time
 #import scipy
 import threading
+import itertools
 try:
-    import Adafruit_ADS1x15
-except:
-    print "Error: Adafruit module not loaded"
+    import Queue as queue
+except ImportError:
+    import queue
+try:
+    from itertools import izip
+except ImportError:
+    izip = zip  # python 3's zip is already lazy
+from .data_manager import get_data_manager
+from .acquisition import AcquisitionThread, RingBuffer
+from .adc_backends import open_backend
+from .signal_processing import median_filter, Debouncer, SettleDetector
+from .capture import CaptureWriter, new_capture_path, CAPTURE_DIR
 
 STRIP_INSERT_THRESHOLD = 5000
 SAMPLE_INSERT_THRESHOLD = 20000
 READING_DELAY = 5
 GAIN = 4
+SAMPLE_RATE = 10         # ADC samples per second
+STRIP_SETTLE_DELAY = 1   # longest to wait for the signal to settle after a strip goes in, in seconds
+POLL_INTERVAL = 0.05     # how often the poller drains the sample buffer, in seconds
+BLOCK_SIZE = 64          # most samples processed at once
+FILTER_WINDOW = 5        # samples in the median filter
+DEBOUNCE_SAMPLES = 3     # consecutive filtered samples past a threshold needed to trigger
+SETTLE_WINDOW = 5        # samples that must stay within SETTLE_TOLERANCE for the strip to count as settled
+SETTLE_TOLERANCE = 500
+
+# States of the strip and sample detection in adc_poller
+WAITING_FOR_STRIP = 'waiting for strip'
+STRIP_SETTLING = 'strip settling'
+WAITING_FOR_SAMPLE = 'waiting for sample'
+READING = 'reading'
+WAITING_FOR_REMOVAL = 'waiting for removal'
+
+# Events adc_poller posts to BloodGlucoseTester.events as (event, value) tuples
+STRIP_INSERTED = 'strip inserted'   # value: None
+SAMPLE_APPLIED = 'sample applied'   # value: None
+PROGRESS = 'progress'               # value: fraction of READING_DELAY elapsed, 0 to 1
+READING_DONE = 'reading done'       # value: the reading in mg/dL
+STRIP_REMOVED = 'strip removed'     # value: None
 
 class ADCPollerThread (threading.Thread):
     def __init__(self, bgtester):
@@ -22,40 +54,145 @@ class ADCPollerThread (threading.Thread):
         print("Stopping ADC Poller...")
 
 class BloodGlucoseTester():
-    def __init__(self, bgscreen):
+    # Each measurement's raw waveform, from the block the strip went in to the one it came out, is
+    # recorded to a capture file in capture_dir; pass capture_dir=None to record nothing
+    def __init__(self, bgscreen, adc=None, sample_rate=SAMPLE_RATE, capture_dir=CAPTURE_DIR):
         self.bgs = bgscreen
-        try:
-            self.adc = Adafruit_ADS1x15.ADS1115()
-        except:
-            pass
-        try:
-            poller_thread = ADCPollerThread(self)
-            poller_thread.daemon = True
-            poller_thread.start()
-        except:
-            print 'could not start thread'
-
-    def open_popup(self):
-        self.bgs.open_popup()
-    def calculate_bg(value):
-        pass
-        #mgpdl = self.slope
-    def adc_poller(self, thread):
+        if adc is None:
+            adc = open_backend()
+        self.adc = adc
+        self.sample_rate = sample_rate
+        self.capture_dir = capture_dir
+        self.capture = None
+        self.buffer = RingBuffer()
+        self.acquisition = None
+        self.poller_thread = None
+        self.stopped = threading.Event()
+        self.events = queue.Queue()
+        self.last_bg = None
+        if self.adc is None:
+            print("Error: Adafruit module not loaded")
+        else:
+            self.start()
+
+    # Starts sampling the ADC and watching the samples for strips and blood
+    def start(self):
+        if self.acquisition is not None:
+            return
     #  - 0 = Channel 0 minus channel 1
     #  - 1 = Channel 0 minus channel 3
     #  - 2 = Channel 1 minus channel 3
     #  - 3 = Channel 2 minus channel 3
-        strip_inserted = False
-        while True:
-            value = self.adc.read_adc_difference(3, gain=GAIN)
-            if value > STRIP_INSERT_THRESHOLD and not strip_inserted:
-                strip_inserted = True
-                time.sleep(1) # make sure we don't take a reading of inserting the strip
-                self.open_popup()
-            if value > SAMPLE_INSERT_THRESHOLD and strip_inserted:
-                time.sleep(READING_DELAY)
-                self.calculate_bg(value)
-                thread.join()
+        self.stopped.clear()
+        self.acquisition = AcquisitionThread(self.adc, self.buffer, self.sample_rate, differential=3, gain=GAIN)
+        self.acquisition.start()
+        self.poller_thread = ADCPollerThread(self)
+        self.poller_thread.daemon = True
+        self.poller_thread.start()
 
+    # Stops both threads and waits for them to finish
+    def stop(self):
+        if self.acquisition is None:
+            return
+        self.stopped.set()
+        self.acquisition.stop()
+        self.acquisition.join()
+        self.poller_thread.join()
+        self.acquisition = None
+        self.poller_thread = None
+        self.end_capture()
 
+    # Tells the UI what the measurement is doing.  This runs on the poller thread, so it never touches
+    # widgets; the screen takes events off the queue on the UI thread.
+    def post(self, event, value=None):
+        self.events.put((event, value))
 
+    # Converts a raw ADC reading to mg/dL with the cached calibration curve
+    def calculate_bg(self, value):
+        return get_data_manager().get_calibration().convert(value)
+
+    # Starts recording a measurement's raw samples, beginning with the samples in pre_roll
+    def begin_capture(self, pre_roll):
+        if self.capture_dir is not None and self.capture is None:
+            self.capture = CaptureWriter(new_capture_path(self.capture_dir), self.sample_rate, GAIN, 3)
+            self.capture.append(pre_roll)
+
+    def end_capture(self):
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
+    # Consumes samples from the acquisition buffer in blocks, median filters them and runs strip and
+    # sample detection on the filtered signal.  Thresholds are debounced, and after a strip goes in
+    # sample detection waits for the signal to settle (or STRIP_SETTLE_DELAY at most) so we don't take
+    # a reading of inserting the strip.  Delays use the samples' own timestamps, so this thread never
+    # blocks the sampling.  After a reading it waits for the strip to be removed and then re-arms.
+    # Progress is posted to self.events as it happens.
+    def adc_poller(self, thread):
+        strip_in = Debouncer(STRIP_INSERT_THRESHOLD, DEBOUNCE_SAMPLES)
+        strip_out = Debouncer(STRIP_INSERT_THRESHOLD, DEBOUNCE_SAMPLES, above=False)
+        sample_in = Debouncer(SAMPLE_INSERT_THRESHOLD, DEBOUNCE_SAMPLES)
+        settle = SettleDetector(SETTLE_WINDOW, SETTLE_TOLERANCE)
+        state = WAITING_FOR_STRIP
+        settle_by = 0
+        reading_at = 0
+        blocks = self.buffer.iter_blocks(BLOCK_SIZE, self.stopped, POLL_INTERVAL)
+        raw_blocks, filter_blocks = itertools.tee(blocks)
+        for (times, raw), (times, values) in izip(raw_blocks, median_filter(filter_blocks, FILTER_WINDOW)):
+            if self.capture is not None:
+                self.capture.append(raw)
+            start = 0
+            while start < len(values):
+                t, v = times[start:], values[start:]
+                if state == WAITING_FOR_STRIP:
+                    found = strip_in.find(v)
+                    if found is not None:
+                        state = STRIP_SETTLING
+                        settle.reset()
+                        settle_by = t[found] + STRIP_SETTLE_DELAY
+                        self.begin_capture(raw)
+                        self.post(STRIP_INSERTED)
+                elif state == STRIP_SETTLING:
+                    found = settle.find(v)
+                    timeout = int(t.searchsorted(settle_by))
+                    if timeout < len(t) and (found is None or timeout < found):
+                        found = timeout
+                    if found is not None:
+                        state = WAITING_FOR_SAMPLE
+                        sample_in.reset()
+                        strip_out.reset()
+                elif state == WAITING_FOR_SAMPLE:
+                    found = sample_in.find(v)
+                    removed = strip_out.find(v)
+                    if removed is not None and (found is None or removed < found):
+                        # strip pulled out before any blood went on
+                        found = removed
+                        state = WAITING_FOR_STRIP
+                        strip_in.reset()
+                        self.end_capture()
+                        self.post(STRIP_REMOVED)
+                    elif found is not None:
+                        state = READING
+                        reading_at = t[found] + READING_DELAY
+                        self.post(SAMPLE_APPLIED)
+                elif state == READING:
+                    found = int(t.searchsorted(reading_at))
+                    if found < len(t):
+                        self.last_bg = self.calculate_bg(float(v[found]))
+                        self.post(READING_DONE, self.last_bg)
+                        state = WAITING_FOR_REMOVAL
+                        strip_out.reset()
+                    else:
+                        found = None
+                elif state == WAITING_FOR_REMOVAL:
+                    found = strip_out.find(v)
+                    if found is not None:
+                        state = WAITING_FOR_STRIP
+                        strip_in.reset()
+                        self.end_capture()
+                        self.post(STRIP_REMOVED)
+                if found is None:
+                    break
+                start += found + 1
+            if state == READING:
+                self.post(PROGRESS, min(1.0, 1 - float(reading_at - times[-1]) / READING_DELAY))
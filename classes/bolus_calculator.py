@@ -0,0 +1,149 @@
+# Bolus calculator: insulin on board (IOB) and carbs on board (COB) from the Bolus and Carbs columns
+# of the log, carb ratios and correction factors fitted to the log, and bolus suggestions from them.
+# How much of a dose is left after a given time comes from a curve tabulated once per minute when
+# the calculator is created, so evaluating thousands of doses is an array lookup rather than an
+# exponential per dose.  Queries only read the entries still active at the time asked about, through
+# the Timestamp index.
+
+import math
+import datetime
+
+import numpy as np
+
+from .data_manager import date_to_timestamp
+
+HOUR = 60*60
+CURVE_STEP = 60                  # seconds between entries of the tabulated curves
+INSULIN_DURATION = 5 * HOUR      # rapid acting insulin
+INSULIN_PEAK = 75 * 60
+CARB_ABSORPTION = 3 * HOUR
+FIT_WINDOW = 4 * HOUR            # how long after an entry its effect on Bg is measured
+FIT_TOLERANCE = 30 * 60          # furthest a reading may be from the end of the window to be used
+TARGET_BG = 110
+
+# Fraction of a rapid acting insulin dose still to act, t seconds after it was taken, for the
+# exponential activity curve with the given duration and time to peak activity
+def insulin_remaining(t, duration=INSULIN_DURATION, peak=INSULIN_PEAK):
+    tau = peak * (1 - float(peak) / duration) / (1 - 2.0 * peak / duration)
+    a = 2 * tau / duration
+    s = 1 / (1 - a + (1 + a) * math.exp(-duration / tau))
+    t = np.asarray(t, dtype=float)
+    return 1 - s * (1 - a) * ((t * t / (tau * duration * (1 - a)) - t / tau - 1) * np.exp(-t / tau) + 1)
+
+# Fraction of a meal's carbs not yet absorbed t seconds after eating, absorbed at a steady rate
+def carbs_remaining(t, duration=CARB_ABSORPTION):
+    return 1 - np.asarray(t, dtype=float) / duration
+
+# A "fraction remaining" curve tabulated every CURVE_STEP seconds for duration seconds.  Before a dose
+# everything remains, and after duration nothing does.
+class Curve:
+
+    def __init__(self, remaining, duration, step=CURVE_STEP):
+        self.duration = duration
+        self.step = step
+        table = np.clip(remaining(np.arange(0, duration + step, step)), 0, 1)
+        self.table = np.append(table, 0.0)
+
+    # Fraction remaining age seconds after the dose, for an array of ages
+    def remaining(self, age):
+        index = np.floor_divide(age, self.step).astype(np.int64)
+        result = self.table[np.clip(index, 0, len(self.table) - 1)]
+        return np.where(index < 0, 1.0, result)
+
+# Pairs every time in times with every dose taken up to before seconds earlier and after seconds
+# later, using the sorted dose timestamps.  Returns (time index, dose index) arrays of the pairs.
+def pair_doses(times, dose_times, before, after):
+    lo = np.searchsorted(dose_times, times - before, side='left')
+    hi = np.searchsorted(dose_times, times + after, side='right')
+    counts = hi - lo
+    time_index = np.repeat(np.arange(len(times)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return time_index, np.repeat(lo, counts) + offsets
+
+class BolusCalculator:
+
+    def __init__(self, dm, insulin_duration=INSULIN_DURATION, insulin_peak=INSULIN_PEAK, carb_absorption=CARB_ABSORPTION):
+        self.dm = dm
+        self.insulin = Curve(lambda t: insulin_remaining(t, insulin_duration, insulin_peak), insulin_duration)
+        self.carbs = Curve(lambda t: carbs_remaining(t, carb_absorption), carb_absorption)
+        self.longest = max(insulin_duration, carb_absorption)
+
+    # Returns (timestamps, carbs, boluses) arrays of the entries with carbs or a bolus from start to end
+    def read_doses(self, start, end):
+        with self.dm.lock:
+            rows = self.dm.con.execute("SELECT Timestamp, IFNULL(Carbs, 0), IFNULL(Bolus, 0) FROM Data "
+                                       "WHERE Timestamp BETWEEN ? AND ? AND (Carbs != 0 OR Bolus != 0) ORDER BY Timestamp",
+                                       (start, end)).fetchall()
+        doses = np.array([tuple(row) for row in rows], dtype=float).reshape(-1, 3)
+        return doses[:, 0], doses[:, 1], doses[:, 2]
+
+    # Returns (insulin on board in units, carbs on board in grams) at the given time (default now).
+    # Only entries from the last insulin duration or carb absorption time are read.
+    def on_board(self, at=None):
+        at = date_to_timestamp(datetime.datetime.now() if at is None else at)
+        times, carbs, boluses = self.read_doses(at - self.longest, at)
+        ages = at - times
+        return float(np.dot(boluses, self.insulin.remaining(ages))), float(np.dot(carbs, self.carbs.remaining(ages)))
+
+    # Returns (iob, cob) arrays for every timestamp in the sorted array times
+    def on_board_series(self, times):
+        times = np.asarray(times)
+        if not len(times):
+            return np.zeros(0), np.zeros(0)
+        dose_times, carbs, boluses = self.read_doses(times[0] - self.longest, times[-1])
+        time_index, dose_index = pair_doses(times, dose_times, self.longest, 0)
+        ages = times[time_index] - dose_times[dose_index]
+        iob = np.bincount(time_index, boluses[dose_index] * self.insulin.remaining(ages), minlength=len(times))
+        cob = np.bincount(time_index, carbs[dose_index] * self.carbs.remaining(ages), minlength=len(times))
+        return iob, cob
+
+    # Fits the carb ratio (grams per unit) and correction factor (mg/dL per unit) to the entries from
+    # start to end.  For every entry with a reading that has another reading FIT_WINDOW later, the
+    # change in Bg is modelled as
+    #     change = carbs absorbed * carb sensitivity - insulin absorbed * correction factor + drift
+    # where the insulin and carbs absorbed over the window include doses taken before the entry, and
+    # all entries are solved together as one least squares problem.  The carb ratio is the correction
+    # factor over the carb sensitivity.  Returns a dict with 'carb_ratio', 'correction_factor' (None
+    # if they can't be determined) and 'events', the number of windows used.
+    def fit_ratios(self, start=None, end=None, window=FIT_WINDOW):
+        rows = self.dm.get_range_array(start, end, ('Timestamp', 'Bg', 'Carbs', 'Bolus'))
+        fit = {'carb_ratio': None, 'correction_factor': None, 'events': 0}
+        readings = rows[rows['Bg'] != 0]
+        doses = rows[(rows['Carbs'] != 0) | (rows['Bolus'] != 0)]
+        if len(readings) < 3 or not len(doses):
+            return fit
+        # the reading closest to the end of each window
+        reading_times = readings['Timestamp']
+        targets = reading_times + window
+        after = np.clip(np.searchsorted(reading_times, targets), 1, len(readings) - 1)
+        closer = np.abs(reading_times[after - 1] - targets) < np.abs(reading_times[after] - targets)
+        outcome = after - closer
+        usable = np.abs(reading_times[outcome] - targets) <= FIT_TOLERANCE
+        starts = reading_times[usable].astype(float)
+        ends = reading_times[outcome[usable]].astype(float)
+        change = readings['Bg'][outcome[usable]].astype(float) - readings['Bg'][usable]
+        if len(starts) < 3:
+            return fit
+        # insulin and carbs absorbed between each start and end, from every dose active in between
+        dose_times = doses['Timestamp'].astype(float)
+        start_index, dose_index = pair_doses(starts, dose_times, self.longest, window + FIT_TOLERANCE)
+        begin_age = starts[start_index] - dose_times[dose_index]
+        end_age = ends[start_index] - dose_times[dose_index]
+        insulin = np.bincount(start_index, doses['Bolus'][dose_index] *
+                              (self.insulin.remaining(begin_age) - self.insulin.remaining(end_age)), minlength=len(starts))
+        carbs = np.bincount(start_index, doses['Carbs'][dose_index] *
+                            (self.carbs.remaining(begin_age) - self.carbs.remaining(end_age)), minlength=len(starts))
+        model = np.column_stack((carbs, -insulin, np.ones(len(starts))))
+        (carb_sensitivity, correction_factor, drift), residuals, rank, singular = np.linalg.lstsq(model, change, rcond=-1)
+        fit['events'] = len(starts)
+        if rank == 3 and correction_factor > 0 and carb_sensitivity > 0:
+            fit['correction_factor'] = float(correction_factor)
+            fit['carb_ratio'] = float(correction_factor / carb_sensitivity)
+        return fit
+
+    # Suggests a bolus in units for eating carbs grams at a reading of bg, bringing Bg back to target
+    # after subtracting the insulin still on board.  Never negative.
+    def suggest_bolus(self, bg, carbs, carb_ratio, correction_factor, target=TARGET_BG, at=None):
+        iob, cob = self.on_board(at)
+        dose = float(carbs) / carb_ratio + (bg - target) / float(correction_factor) - iob
+        return max(dose, 0.0)
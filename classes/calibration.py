@@ -0,0 +1,106 @@
+# Fits and applies the ADC reading to mg/dL calibration curve from the points in the "CalibData" table.
+# The fit is a polynomial least squares fit kept as its normal equations (the moment sums of the
+# points), so new calibration points are folded in by reading only the rows added since the last fit.
+# Coefficients and moments are cached in the "CalibFit" table, and converting a reading is a Horner
+# evaluation of a degree one or two polynomial.
+
+import json
+import threading
+
+import numpy as np
+
+# ADC readings are 16 bit signed, so scaling by this keeps x within [-1, 1] and the normal equations
+# well conditioned even for quadratic fits
+ADC_SCALE = 1.0 / 32768
+
+class Calibration:
+
+    def __init__(self, dm, degree=1):
+        self.dm = dm
+        self.degree = degree
+        self.lock = threading.RLock()
+        self.stale = True
+        self.last_rowid = 0
+        self.points = 0
+        self.matrix = np.zeros((degree + 1, degree + 1))
+        self.vector = np.zeros(degree + 1)
+        self.coefficients = np.zeros(degree + 1)
+        self.terms = self.coefficients.tolist()
+        self.load()
+
+    # Loads the cached fit from the database, if there is one
+    def load(self):
+        with self.dm.lock:
+            row = self.dm.con.execute("SELECT LastRowid, Points, Moments, Coefficients FROM CalibFit WHERE Degree = ?",
+                                      (self.degree,)).fetchone()
+        if row is not None:
+            moments = json.loads(row[2])
+            self.last_rowid = row[0]
+            self.points = row[1]
+            self.matrix = np.array(moments['matrix'], dtype=float)
+            self.vector = np.array(moments['vector'], dtype=float)
+            self.coefficients = np.array(json.loads(row[3]), dtype=float)
+            self.terms = self.coefficients.tolist()
+
+    # Saves the current fit to the database
+    def save(self):
+        moments = json.dumps({'matrix': self.matrix.tolist(), 'vector': self.vector.tolist()})
+        with self.dm.lock:
+            with self.dm.con:
+                self.dm.con.execute("INSERT OR REPLACE INTO CalibFit(Degree, LastRowid, Points, Moments, Coefficients) VALUES (?, ?, ?, ?, ?)",
+                                    (self.degree, self.last_rowid, self.points, moments, json.dumps(self.coefficients.tolist())))
+
+    # Returns the moment sums (V^T V, V^T y) of the points, where V is the Vandermonde matrix of the scaled ADC values
+    def moments(self, adc, actual):
+        vandermonde = np.vander(adc * ADC_SCALE, self.degree + 1)
+        return vandermonde.T.dot(vandermonde), vandermonde.T.dot(actual)
+
+    # Reads the calibration points with a rowid above after as two float arrays
+    def read_points(self, after):
+        with self.dm.lock:
+            rows = self.dm.con.execute("SELECT ADC, Actual FROM CalibData WHERE rowid > ? ORDER BY rowid", (after,)).fetchall()
+            last_rowid, count = self.dm.con.execute("SELECT IFNULL(MAX(rowid), 0), COUNT(*) FROM CalibData").fetchone()
+        points = np.array([tuple(row) for row in rows], dtype=float).reshape(-1, 2)
+        return points[:, 0], points[:, 1], last_rowid, count
+
+    # Brings the fit up to date with the "CalibData" table.  New points are added to the stored moments;
+    # if points were deleted the moments are rebuilt from every point.
+    def refresh(self):
+        with self.lock:
+            adc, actual, last_rowid, count = self.read_points(self.last_rowid)
+            if self.points + len(adc) != count:
+                adc, actual, last_rowid, count = self.read_points(0)
+                self.matrix = np.zeros((self.degree + 1, self.degree + 1))
+                self.vector = np.zeros(self.degree + 1)
+                self.points = 0
+            if len(adc) or last_rowid != self.last_rowid:
+                matrix, vector = self.moments(adc, actual)
+                self.matrix = self.matrix + matrix
+                self.vector = self.vector + vector
+                self.points += len(adc)
+                self.last_rowid = last_rowid
+                # lstsq copes with fewer points than coefficients by returning the minimum norm fit
+                self.coefficients = np.linalg.lstsq(self.matrix, self.vector, rcond=-1)[0]
+                self.terms = self.coefficients.tolist()
+                self.save()
+            self.stale = False
+
+    # Marks the fit out of date; the next conversion refits first
+    def invalidate(self):
+        self.stale = True
+
+    # Converts a raw ADC reading to mg/dL
+    def convert(self, adc):
+        if self.stale:
+            self.refresh()
+        x = adc * ADC_SCALE
+        value = 0.0
+        for coefficient in self.terms:
+            value = value * x + coefficient
+        return value
+
+    # Converts an array of raw ADC readings to mg/dL
+    def convert_array(self, adc):
+        if self.stale:
+            self.refresh()
+        return np.polyval(self.coefficients, np.asarray(adc, dtype=float) * ADC_SCALE)
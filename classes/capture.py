@@ -0,0 +1,113 @@
+# Compact binary format for raw ADC captures.  A capture file is a fixed HEADER_SIZE byte header
+# (magic, format version, differential channel, sample rate, gain and the wall clock start time)
+# followed by the samples as little endian int16, one per sample period.  Files are only ever appended
+# to, so the sample count comes from the file size and a capture cut short by a crash is still
+# readable.  Reading memory maps the samples, so opening a capture copies nothing.
+# Existing text traces are converted with:  python -m classes.capture trials/*.txt [--out captures]
+
+import os
+import sys
+import time
+import struct
+
+import numpy as np
+
+from .adc_backends import load_trace
+
+MAGIC = b'GLUCAP\x00\x01'
+VERSION = 1
+HEADER = struct.Struct('<8sHHdfd')  # magic, version, channel, sample rate, gain, start time
+HEADER_SIZE = 64                    # room for more header fields without moving the samples
+SAMPLE_DTYPE = np.dtype('<i2')
+EXTENSION = '.cap'
+CAPTURE_DIR = 'captures'
+
+# Appends samples to a new capture file
+class CaptureWriter:
+
+    def __init__(self, path, sample_rate, gain=1, channel=3, started=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.samples = 0
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if started is None:
+            started = time.time()
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, channel, sample_rate, gain, started).ljust(HEADER_SIZE, b'\0'))
+
+    # Appends an array of raw readings, clipped to the int16 range
+    def append(self, values):
+        values = np.clip(np.asarray(values), -32768, 32767).astype(SAMPLE_DTYPE)
+        values.tofile(self.file)
+        self.samples += len(values)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+# A capture file opened for reading.  values is a read only memory map of the samples.
+class Capture(object):
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a capture file" % path)
+        magic, self.version, self.channel, self.sample_rate, self.gain, self.started = HEADER.unpack(header[:HEADER.size])
+        # a partly written last sample (from a crash mid append) is ignored
+        count = (os.path.getsize(path) - HEADER_SIZE) // SAMPLE_DTYPE.itemsize
+        if count > 0:
+            self.values = np.memmap(path, dtype=SAMPLE_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.values = np.empty(0, dtype=SAMPLE_DTYPE)
+
+    def __len__(self):
+        return len(self.values)
+
+    # Sample times in seconds from the start of the capture
+    @property
+    def times(self):
+        return np.arange(len(self.values)) / float(self.sample_rate)
+
+def open_capture(path):
+    return Capture(path)
+
+# Returns the path for a new capture in directory, named after the current time
+def new_capture_path(directory=CAPTURE_DIR):
+    name = time.strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, name + EXTENSION)
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, '%s-%d%s' % (name, suffix, EXTENSION))
+        suffix += 1
+    return path
+
+# Converts a text trace to a capture file at out_path.  The traces were recorded at a fixed rate, so
+# the sample rate is taken from the median time step and the times themselves aren't stored.
+def convert_trace(path, out_path, gain=1, channel=3):
+    times, values = load_trace(path)
+    steps = np.diff(times)
+    sample_rate = 1.0 / np.median(steps) if len(steps) else 1.0
+    writer = CaptureWriter(out_path, round(sample_rate, 6), gain, channel, started=0)
+    writer.append(values)
+    writer.close()
+    return writer.samples
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    out_dir = CAPTURE_DIR
+    if len(args) >= 2 and args[-2] == '--out':
+        out_dir = args[-1]
+        args = args[:-2]
+    if not args:
+        print("usage: python -m classes.capture trace.txt ... [--out captures]")
+        sys.exit(1)
+    for path in args:
+        out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + EXTENSION)
+        samples = convert_trace(path, out_path)
+        print("%s -> %s: %d samples, %d bytes (was %d)" % (path, out_path, samples, os.path.getsize(out_path), os.path.getsize(path)))
@@ -0,0 +1,56 @@
+# Column layout for the data log.  Text widths are measured once with the core text provider and cached
+# by (text, font size, font name), then one width per column is computed for the whole table in a
+# single pass.  Rows bind to the shared widths instead of refreshing their label textures and
+# re-laying themselves out until the sizes settle.
+
+from kivy.event import EventDispatcher
+from kivy.properties import NumericProperty
+from kivy.core.text import Label as CoreLabel, DEFAULT_FONT
+from kivy.metrics import sp, dp
+
+# Measures rendered text widths without creating textures, remembering every string it has seen
+class TextMeasurer(object):
+
+    def __init__(self):
+        self.cache = {}
+
+    def width(self, text, font_size, font_name=DEFAULT_FONT):
+        key = (text, font_size, font_name)
+        width = self.cache.get(key)
+        if width is None:
+            label = CoreLabel(text=text, font_size=font_size, font_name=font_name)
+            width = self.cache[key] = label.get_extents(text)[0]
+        return width
+
+# Shared column widths for every EntryRow.  Columns only ever grow, so adding an entry with a
+# wider value widens that column everywhere and deleting one never causes a relayout.
+class ColumnLayout(EventDispatcher):
+
+    bg_width = NumericProperty(dp(35))
+    carbs_width = NumericProperty(dp(30))
+    bolus_width = NumericProperty(dp(30))
+
+    def __init__(self, font_size=None, font_name=DEFAULT_FONT, padding=None, **kwargs):
+        super(ColumnLayout, self).__init__(**kwargs)
+        self.measurer = TextMeasurer()
+        self.font_size = sp(15) if font_size is None else font_size
+        self.font_name = font_name
+        self.padding = dp(10) if padding is None else padding
+        self.minimum_widths = {'bg': self.bg_width, 'carbs': self.carbs_width, 'bolus': self.bolus_width}
+
+    # Width a label needs to show text, including padding
+    def text_width(self, text):
+        return self.measurer.width(text, self.font_size, self.font_name) + self.padding
+
+    # Computes the width of each named column from all the texts it will show.  columns maps a
+    # column name ('bg', 'carbs' or 'bolus') to an iterable of its texts; duplicates are measured once.
+    def compute(self, columns):
+        for name, texts in columns.items():
+            widest = max([self.text_width(text) for text in set(texts)] or [0])
+            setattr(self, name + '_width', max(widest, self.minimum_widths[name]))
+
+    # Widens a column if text doesn't fit in it
+    def fit(self, name, text):
+        width = self.text_width(text)
+        if width > getattr(self, name + '_width'):
+            setattr(self, name + '_width', width)
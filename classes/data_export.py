@@ -0,0 +1,185 @@
+# Export of the "Data" table to CSV, JSON Lines or a compact columnar binary file.  Rows are streamed
+# from sqlite in chunks (DataManager.iter_export) and written as they arrive, so memory use is the
+# same whatever the size of the log.  Exports can be limited to a date range, and an export given a
+# name with --since only writes the entries added since the last export with that name.  The CSV and
+# JSON Lines files use the column names data_import.py reads, so they can be imported again.
+# Usage:  python -m classes.data_export [--db data.db] [--format csv|jsonl|binary] [--from date] [--to date] [--since name] out
+
+import os
+import sys
+import csv
+import json
+import struct
+import itertools
+
+import numpy as np
+
+from .data_manager import DataManager, timestamp_to_date
+
+FIELDS = ('Date', 'Bg', 'Carbs', 'Bolus', 'Notes')
+
+# Columnar binary format: MAGIC, then blocks of up to BLOCK_SIZE entries, each a BLOCK_HEADER of
+# (entries, bytes of notes) followed by every column of the block in turn, as little endian arrays
+# of BINARY_COLUMNS, then the end offset of each entry's notes and the notes themselves in UTF-8.
+MAGIC = b'GLUEXP\x00\x01'
+BLOCK_HEADER = struct.Struct('<II')
+BLOCK_SIZE = 4096
+BINARY_COLUMNS = (('Id', '<i8'), ('Timestamp', '<i8'), ('Bg', '<i4'), ('Carbs', '<i4'), ('Bolus', '<f8'))
+NOTES_OFFSET_DTYPE = '<u4'
+
+# Extension implying each format when none is given
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.json': 'jsonl', '.bin': 'binary'}
+
+# Returns a function formatting timestamps as yyyy-mm-dd hh:mm (with :ss when the seconds aren't
+# zero).  Each day's date is only formatted once, which keeps formatting from dominating the export.
+def date_formatter():
+    days = {}
+
+    def format_date(timestamp):
+        day, seconds = divmod(timestamp, 86400)
+        date = days.get(day)
+        if date is None:
+            date = days[day] = timestamp_to_date(day * 86400).strftime('%Y-%m-%d')
+        minutes, second = divmod(seconds, 60)
+        if second:
+            return '%s %02d:%02d:%02d' % (date, minutes // 60, minutes % 60, second)
+        return '%s %02d:%02d' % (date, minutes // 60, minutes % 60)
+    return format_date
+
+# Returns notes as the UTF-8 str the csv module writes on Python 2, and unchanged on Python 3
+def csv_text(notes):
+    return notes if isinstance(notes, str) else notes.encode('utf-8')
+
+# Writes the rows (as yielded by iter_export) as CSV with a header row.  Returns the number written.
+def write_csv(rows, f):
+    format_date = date_formatter()
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    count = 0
+    for chunk in chunks(rows, BLOCK_SIZE):
+        writer.writerows([(format_date(timestamp), bg, carbs, bolus, csv_text(notes))
+                          for entry_id, timestamp, bg, carbs, bolus, notes in chunk])
+        count += len(chunk)
+    return count
+
+# Writes the rows as JSON Lines, one object per entry.  Returns the number written.  The numbers and
+# dates never need escaping, so only the notes go through the json module.
+def write_jsonl(rows, f):
+    format_date = date_formatter()
+    dumps = json.dumps
+    line = '{"bg": %s, "bolus": %s, "carbs": %s, "date": "%s", "notes": %s}\n'
+    count = 0
+    for chunk in chunks(rows, BLOCK_SIZE):
+        f.write(''.join([line % (bg, bolus, carbs, format_date(timestamp), dumps(notes))
+                         for entry_id, timestamp, bg, carbs, bolus, notes in chunk]))
+        count += len(chunk)
+    return count
+
+# Writes the rows in the columnar binary format.  Returns the number written.
+def write_binary(rows, f):
+    f.write(MAGIC)
+    count = 0
+    for chunk in chunks(rows, BLOCK_SIZE):
+        columns = list(zip(*chunk))
+        notes = [note.encode('utf-8') for note in columns[-1]]
+        offsets = np.cumsum([len(note) for note in notes]).astype(NOTES_OFFSET_DTYPE)
+        f.write(BLOCK_HEADER.pack(len(chunk), int(offsets[-1])))
+        for (name, dtype), column in zip(BINARY_COLUMNS, columns):
+            f.write(np.array(column, dtype=dtype).tobytes())
+        f.write(offsets.tobytes())
+        f.write(b''.join(notes))
+        count += len(chunk)
+    return count
+
+# Yields the blocks of a binary export as dicts of column arrays, with 'Notes' a list of strings
+def read_binary(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a glucometer export")
+    while True:
+        header = f.read(BLOCK_HEADER.size)
+        if not header:
+            break
+        entries, notes_size = BLOCK_HEADER.unpack(header)
+        block = {}
+        for name, dtype in BINARY_COLUMNS:
+            block[name] = np.frombuffer(f.read(entries * np.dtype(dtype).itemsize), dtype=dtype)
+        ends = np.frombuffer(f.read(entries * np.dtype(NOTES_OFFSET_DTYPE).itemsize), dtype=NOTES_OFFSET_DTYPE)
+        notes = f.read(notes_size)
+        starts = np.concatenate(([0], ends[:-1]))
+        block['Notes'] = [notes[start:end].decode('utf-8') for start, end in zip(starts.tolist(), ends.tolist())]
+        yield block
+
+# Yields lists of up to size items from iterable
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'binary': write_binary}
+
+# Returns the format implied by a file name
+def guess_format(path):
+    fmt = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError("can't tell the export format of %s; give one of %s" % (path, ', '.join(sorted(WRITERS))))
+    return fmt
+
+# Opens a file for writing in the given format: binary, or text in the way the csv module wants
+def open_output(path, fmt):
+    if fmt == 'binary' or (fmt == 'csv' and sys.version_info[0] < 3):
+        return open(path, 'wb')
+    if fmt == 'csv':
+        return open(path, 'w', newline='')
+    return open(path, 'w')
+
+# Exports the entries between start and end (None for no bound) to path ('-' for standard output).
+# With since set, only entries added since the last export called since are written, and the mark
+# only moves once the whole file is written, so an export that fails part way is simply redone.
+# Combined with a range, entries outside it are passed over for good by later exports of that name.
+# Files are written under a temporary name and renamed into place.  Returns the number written.
+def export(dm, path, fmt=None, start=None, end=None, since=None):
+    if fmt is None:
+        fmt = 'csv' if path == '-' else guess_format(path)
+    write = WRITERS[fmt]
+    first_id = dm.get_export_mark(since) + 1 if since is not None else 0
+    last_id = dm.last_id()  # entries added while exporting are left for the next export
+    rows = dm.iter_export(start, end, first_id, last_id)
+    if path == '-':
+        out = sys.stdout.buffer if fmt == 'binary' and hasattr(sys.stdout, 'buffer') else sys.stdout
+        count = write(rows, out)
+        out.flush()
+    else:
+        temporary = path + '.tmp'
+        with open_output(temporary, fmt) as out:
+            count = write(rows, out)
+        os.rename(temporary, path)
+    if since is not None:
+        dm.set_export_mark(since, last_id)
+    return count
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    db_path = fmt = start = end = since = None
+    while len(args) > 1 and args[0] in ('--db', '--format', '--from', '--to', '--since'):
+        option, value = args[0], args[1]
+        args = args[2:]
+        if option == '--db':
+            db_path = value
+        elif option == '--format':
+            fmt = value
+        elif option == '--from':
+            start = value
+        elif option == '--to':
+            end = value
+        else:
+            since = value
+    if len(args) != 1 or (fmt is not None and fmt not in WRITERS):
+        print("usage: python -m classes.data_export [--db data.db] [--format csv|jsonl|binary] [--from date] [--to date] [--since name] out")
+        sys.exit(1)
+    dm = DataManager(db_path)
+    count = export(dm, args[0], fmt, start, end, since)
+    dm.close()
+    sys.stderr.write("%s: exported %d entries\n" % (args[0], count))
@@ -0,0 +1,120 @@
+# Bulk import of historical readings exported from other meters.  Reads CSV files with a header row or
+# JSON Lines files and streams them into the "Data" table through DataManager.new_entries, so a whole
+# file is written in one transaction.
+# Usage:  python -m classes.data_import [--db data.db] export.csv [more.jsonl ...]
+
+import csv
+import json
+import sys
+import datetime
+
+from .data_manager import DataManager, date_to_timestamp, EPOCH_ORDINAL
+
+# Names other meters and spreadsheets use for each of our columns, lower case
+FIELD_ALIASES = {
+    'date': ('date', 'datetime', 'timestamp', 'time', 'datecolumn'),
+    'bg': ('bg', 'glucose', 'bloodglucose', 'blood glucose', 'mg/dl', 'value'),
+    'carbs': ('carbs', 'carbohydrates'),
+    'bolus': ('bolus', 'insulin'),
+    'notes': ('notes', 'note', 'comment', 'comments'),
+}
+
+# Returns {our field: their column name} for the column names in a file
+def map_fields(names):
+    lowered = dict((name.strip().lower(), name) for name in names)
+    mapping = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                mapping[field] = lowered[alias]
+                break
+    if 'date' not in mapping:
+        raise ValueError("no date column in %s" % (', '.join(names),))
+    return mapping
+
+# Returns a function converting the date strings found in exports to timestamps.  The common
+# yyyy-mm-dd hh:mm[:ss] forms skip strptime and reuse the midnight timestamp of each day, which
+# keeps parsing from dominating the import time.
+def timestamp_parser():
+    days = {}
+
+    def parse(value):
+        if isinstance(value, (int, float)):
+            return int(value)
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        if len(value) >= 16 and value[4] == '-' and value[7] == '-' and value[10] in ' T' and value[13] == ':':
+            day = value[:10]
+            midnight = days.get(day)
+            if midnight is None:
+                midnight = days[day] = (datetime.date(int(value[:4]), int(value[5:7]), int(value[8:10])).toordinal() - EPOCH_ORDINAL)*86400
+            seconds = int(value[17:19]) if len(value) >= 19 and value[16] == ':' else 0
+            return midnight + int(value[11:13])*3600 + int(value[14:16])*60 + seconds
+        return date_to_timestamp(value)
+    return parse
+
+# Converts a number from an export to the int or float the database expects.  Blanks become 0.
+def to_number(value):
+    if value is None or value == '':
+        return 0
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if number == int(number):
+            return int(number)
+        return number
+
+# Yields (timestamp, bg, carbs, bolus, notes) entries from records, which are dicts keyed by the export's column names
+def records_to_entries(records, mapping):
+    parse = timestamp_parser()
+    date, bg, carbs, bolus, notes = (mapping.get(field) for field in ('date', 'bg', 'carbs', 'bolus', 'notes'))
+    for record in records:
+        yield (parse(record[date]),
+               to_number(record.get(bg)) if bg else 0,
+               to_number(record.get(carbs)) if carbs else 0,
+               to_number(record.get(bolus)) if bolus else 0,
+               (record.get(notes) or ' ') if notes else ' ')
+
+# Yields the entries in a CSV file with a header row
+def read_csv(f):
+    reader = csv.DictReader(f)
+    return records_to_entries(reader, map_fields(reader.fieldnames))
+
+# Yields the entries in a JSON Lines file, one object per line
+def read_jsonl(f):
+    records = (json.loads(line) for line in f if line.strip())
+    first = next(records, None)
+    if first is None:
+        return iter(())
+
+    def all_records():
+        yield first
+        for record in records:
+            yield record
+    return records_to_entries(all_records(), map_fields(list(first.keys())))
+
+# Imports a CSV or JSON Lines file into the database.  Returns the number of entries added.
+def import_file(dm, path):
+    with open(path) as f:
+        if path.endswith('.jsonl') or path.endswith('.json'):
+            entries = read_jsonl(f)
+        else:
+            entries = read_csv(f)
+        return dm.new_entries(entries)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    db_path = None
+    if len(args) >= 2 and args[0] == '--db':
+        db_path = args[1]
+        args = args[2:]
+    if not args:
+        print("usage: python -m classes.data_import [--db data.db] file.csv|file.jsonl ...")
+        sys.exit(1)
+    dm = DataManager(db_path)
+    for path in args:
+        print("%s: imported %d entries" % (path, import_file(dm, path)))
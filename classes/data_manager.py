@@ -2,55 +2,497 @@
 # -*- coding: utf-8 -*-
 
 import sqlite3 as lite
+import os
 import sys
-#from scipy.stats import linregress
-from numpy import empty
+import threading
+import contextlib
+import atexit
+import numpy as np
 import math
+import numbers
 import datetime
 
+from . import migrations
+from .calibration import Calibration
+from .analytics import Analytics
+
+DB_PATH = 'data.db'
+# Number of compiled statements sqlite keeps per connection.  Every query below uses a constant
+# SQL string so repeated calls hit this cache instead of re-preparing the statement.
+STATEMENT_CACHE_SIZE = 128
+# Rows fetched from sqlite at a time by the lazy range queries, and by exports
+RANGE_CHUNK_SIZE = 512
+EXPORT_CHUNK_SIZE = 4096
+# Most entries a notes search returns by default
+SEARCH_LIMIT = 200
+# Largest number of Ids an export reads by Id and sorts in memory rather than in Timestamp index order
+EXPORT_SORT_LIMIT = 65536
+
+# Columns of the Data table that range queries may return, with their NumPy types
+RANGE_COLUMNS = {
+    'Id': 'i8',
+    'Timestamp': 'i8',
+    'Bg': 'i4',
+    'Carbs': 'i4',
+    'Bolus': 'f8',
+    'Notes': 'O',
+}
+
+# Fields of an entry update_entries can change, with their columns in the Data table
+EDITABLE_FIELDS = {
+    'date': 'Timestamp',
+    'bg': 'Bg',
+    'carbs': 'Carbs',
+    'bolus': 'Bolus',
+    'notes': 'Notes',
+}
+
+# How data.db is written, chosen with the storage argument of DataManager or the GLUCOMETER_STORAGE
+# environment variable.  All but "rollback" use write-ahead logging, where readers never block the
+# writer and a commit appends to the -wal file instead of rewriting the database:
+#   journal_mode         sqlite journal mode
+#   synchronous          sqlite synchronous level.  With WAL, NORMAL only syncs at checkpoints, so
+#                        commits never wait for the SD card, and a power cut can lose the last few
+#                        commits but never corrupts the file; FULL syncs every commit as well.
+#   commit_window        seconds single writes are held in an open transaction so writes arriving
+#                        close together share one commit (0 commits every write immediately).  The
+#                        writes are visible to this DataManager straight away.
+#   checkpoint_interval  seconds between checkpoints copying the WAL back into the database, run
+#                        from a background thread on its own connection (0 leaves it to sqlite)
+STORAGE_MODES = {
+    'durable': {'journal_mode': 'WAL', 'synchronous': 'FULL', 'commit_window': 0, 'checkpoint_interval': 60},
+    'balanced': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'commit_window': 0.25, 'checkpoint_interval': 60},
+    'rollback': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'commit_window': 0, 'checkpoint_interval': 0},
+}
+DEFAULT_STORAGE_MODE = 'balanced'
+
+# Timestamps are seconds since the epoch of the meter's local wall-clock time, so they round trip
+# exactly to the date and time the user entered regardless of timezone or daylight saving.
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+# Bounds used for open ended range queries
+MIN_TIMESTAMP = -2**62
+MAX_TIMESTAMP = 2**62
+
+# Converts strings in the format m/d/y, yyyy-mm-dd or yyyy-mm-dd hh:mm to a datetime object
+def str_to_date(strdate):
+    if '/' in strdate:
+        split_date = strdate.split('/')
+        m = int(split_date[0])
+        d = int(split_date[1])
+        y = int(split_date[2])
+        h = 0
+        mins = 0
+        if y < 100:
+            y = int('20' + str(y))
+
+    else:
+        try:
+            dateobj = datetime.datetime.strptime( strdate, "%Y-%m-%d %H:%M" )
+            return dateobj
+        except:
+            pass
+        try:
+            dateobj = datetime.datetime.strptime( strdate, "%Y-%m-%d" )
+            return dateobj
+        except:
+            pass
+
+    return datetime.datetime(year=y, month=m, day=d, hour=h, minute=mins)
+
+# Converts a date string, date or datetime object to integer epoch seconds.  Integers are assumed
+# to already be timestamps and are returned unchanged.
+def date_to_timestamp(date):
+    if type(date) is int or isinstance(date, numbers.Integral):
+        return int(date)
+    if isinstance(date, datetime.datetime):
+        return (date.toordinal() - EPOCH_ORDINAL)*86400 + date.hour*3600 + date.minute*60 + date.second
+    if isinstance(date, datetime.date):
+        return (date.toordinal() - EPOCH_ORDINAL)*86400
+    # yyyy-mm-dd hh:mm is what the app itself writes, so convert it without going through strptime
+    if len(date) == 16 and date[4] == '-' and date[7] == '-' and date[10] == ' ' and date[13] == ':':
+        day = datetime.date(int(date[:4]), int(date[5:7]), int(date[8:10]))
+        return (day.toordinal() - EPOCH_ORDINAL)*86400 + int(date[11:13])*3600 + int(date[14:16])*60
+    return date_to_timestamp(str_to_date(date))
+
+# Converts integer epoch seconds back to a datetime object
+def timestamp_to_date(timestamp):
+    return EPOCH + datetime.timedelta(seconds=timestamp)
+
+_shared_manager = None
+_shared_lock = threading.Lock()
+
+# Returns the process-wide DataManager, opening the database and creating the schema on first use.
+# Widgets should use this instead of constructing their own DataManager.
+def get_data_manager():
+    global _shared_manager
+    if _shared_manager is None:
+        with _shared_lock:
+            if _shared_manager is None:
+                _shared_manager = DataManager()
+                # don't lose writes still waiting for the commit window if the process just exits
+                atexit.register(_shared_manager.commit)
+    return _shared_manager
+
+# Periodically checkpoints a WAL mode database from its own connection, so the fsyncs of copying the
+# log back into the database never happen while the shared connection's lock is held
+class Checkpointer(threading.Thread):
+
+    def __init__(self, path, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        con = lite.connect(self.path)
+        try:
+            while not self.stopped.wait(self.interval):
+                self.checkpoint(con, 'PASSIVE')
+            self.checkpoint(con, 'TRUNCATE')
+        finally:
+            con.close()
+
+    def checkpoint(self, con, mode):
+        try:
+            con.execute("PRAGMA wal_checkpoint(%s)" % mode).fetchall()
+        except lite.OperationalError:
+            pass  # busy or locked; the next one will catch up
+
 class DataManager:
-    def __init__(self):
-        self.con = lite.connect('data.db')
-        cur = self.con.cursor()
-        # Table for storing date, time, blood glucose value, carbs, bolus, and notes
-        cur.execute("CREATE TABLE IF NOT EXISTS Data(Id INTEGER PRIMARY KEY, DateColumn date, Bg INT, Carbs INT, Bolus INT, Notes Text)")
-        # Table for storing points with which to calibrate the meter.
-        cur.execute("CREATE TABLE IF NOT EXISTS CalibData(ADC INT, Actual INT)")
-
-    # Adds a new data point to the "Data" table
+    def __init__(self, path=None, storage=None):
+        if path is None:
+            path = DB_PATH
+        self.path = path
+        if storage is None:
+            storage = os.environ.get('GLUCOMETER_STORAGE', DEFAULT_STORAGE_MODE)
+        if not isinstance(storage, dict):
+            storage = STORAGE_MODES[storage]
+        self.storage = storage
+        # One connection is shared by the UI and the ADC poller thread, so writes are serialized by a lock
+        self.lock = threading.RLock()
+        self.con = lite.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        self.con.row_factory = lite.Row
+        self.commit_window = storage['commit_window']
+        self.commit_timer = None
+        self.checkpointer = None
+        self.closed = False
+        self.configure_storage()
+        self.create_schema()
+        with self.lock:
+            self.notes_index = self.con.execute("SELECT 1 FROM sqlite_master WHERE name = 'NotesIndex'").fetchone() is not None
+        # Calibration curves by polynomial degree, created on first use
+        self.calibrations = {}
+        self.analytics = None
+
+    # Creates the tables, or upgrades an older data.db to the current schema.  Only needs to run once per connection.
+    def create_schema(self):
+        with self.lock:
+            migrations.migrate(self.con)
+
+    # Sets the journal mode and sync level, and starts checkpointing in the background in WAL mode
+    def configure_storage(self):
+        storage = self.storage
+        with self.lock:
+            journal_mode = self.con.execute("PRAGMA journal_mode = %s" % storage['journal_mode']).fetchone()[0]
+            self.con.execute("PRAGMA synchronous = %s" % storage['synchronous'])
+            # in-memory and some network filesystems can't use WAL, and stay in their own journal mode
+            if journal_mode.lower() == 'wal' and storage['checkpoint_interval']:
+                self.con.execute("PRAGMA wal_autocheckpoint = 0")
+                self.checkpointer = Checkpointer(self.path, storage['checkpoint_interval'])
+                self.checkpointer.start()
+
+    # Wraps a write.  Without a commit window the write is committed when the block ends, or rolled
+    # back if it raises.  With one, the transaction is left open and committed by a timer commit_window
+    # seconds after the first write into it, so a burst of writes shares one commit.  sqlite undoes a
+    # failed statement by itself, so an exception never loses the other writes waiting to commit.
+    @contextlib.contextmanager
+    def writing(self):
+        with self.lock:
+            if not self.commit_window:
+                with self.con:
+                    yield self.con
+                return
+            yield self.con
+            if self.commit_timer is None:
+                self.commit_timer = threading.Timer(self.commit_window, self.commit)
+                self.commit_timer.daemon = True
+                self.commit_timer.start()
+
+    # Commits any writes waiting for the commit window
+    def commit(self):
+        with self.lock:
+            if self.commit_timer is not None:
+                self.commit_timer.cancel()
+                self.commit_timer = None
+            if not self.closed:
+                self.con.commit()
+
+    # Commits pending writes, stops checkpointing and closes the underlying connection
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.commit()
+            if self.checkpointer is not None:
+                self.checkpointer.stop()
+                self.checkpointer.join()
+                self.checkpointer = None
+            self.con.close()
+            self.closed = True
+
+    # Adds a new data point to the "Data" table.  Returns the Id of the new entry.
     def new_entry(self, date, bg, carbs, bolus, notes):
-        self.con.execute("INSERT INTO data(DateColumn, Bg, Carbs, Bolus, Notes)  VALUES ('"+date+"',"+str(bg)+","+str(carbs)+","+str(bolus)+",'"+notes+"')")
-        self.con.commit()
+        with self.lock:
+            with self.writing():
+                cur = self.con.execute("INSERT INTO Data(Timestamp, Bg, Carbs, Bolus, Notes) VALUES (?, ?, ?, ?, ?)",
+                                       (date_to_timestamp(date), bg, carbs, bolus, notes))
+            return cur.lastrowid
+
+    # Adds many (date, bg, carbs, bolus, notes) entries to the "Data" table in a single transaction.
+    # entries may be any iterable, including a generator, so huge imports never sit in memory at once.
+    def new_entries(self, entries):
+        rows = ((date_to_timestamp(date), bg, carbs, bolus, notes) for date, bg, carbs, bolus, notes in entries)
+        with self.lock:
+            with self.con:
+                cur = self.con.executemany("INSERT INTO Data(Timestamp, Bg, Carbs, Bolus, Notes) VALUES (?, ?, ?, ?, ?)", rows)
+            return cur.rowcount
+
+    # Replaces every value of the entry with the given Id.  Returns whether the entry exists.
+    def update_entry(self, entry_id, date, bg, carbs, bolus, notes):
+        with self.lock:
+            with self.writing():
+                cur = self.con.execute("UPDATE Data SET Timestamp = ?, Bg = ?, Carbs = ?, Bolus = ?, Notes = ? WHERE Id = ?",
+                                       (date_to_timestamp(date), bg, carbs, bolus, notes, entry_id))
+            return cur.rowcount > 0
 
-    # Deletes an entry from the "Data" table
-    def delete_entry(self, date, bg, carbs, bolus, notes ):
-        self.con.execute("DELETE FROM data WHERE Id =(SELECT MIN(Id) FROM data WHERE DateColumn='%s' AND Bg=%d AND Carbs =%d AND Bolus =%d AND Notes='%s')" % (date, bg, carbs, bolus, notes))
+    # Sets the same values on every entry in entry_ids in a single transaction.  changes maps any of
+    # the names in EDITABLE_FIELDS to the new value; fields left out keep their values.  Returns the
+    # number of entries changed.
+    def update_entries(self, entry_ids, changes):
+        fields = sorted(changes)
+        for field in fields:
+            if field not in EDITABLE_FIELDS:
+                raise ValueError("unknown field %r" % (field,))
+        if not fields:
+            return 0
+        values = [date_to_timestamp(changes[field]) if field == 'date' else changes[field] for field in fields]
+        sql = "UPDATE Data SET " + ", ".join(EDITABLE_FIELDS[field] + " = ?" for field in fields) + " WHERE Id = ?"
+        with self.lock:
+            with self.con:
+                cur = self.con.executemany(sql, (values + [entry_id] for entry_id in entry_ids))
+            return cur.rowcount
 
-        self.con.commit()
+    # Deletes the entry with the given Id from the "Data" table.  Returns whether it existed.
+    def delete_entry(self, entry_id):
+        with self.lock:
+            with self.writing():
+                cur = self.con.execute("DELETE FROM Data WHERE Id = ?", (entry_id,))
+            return cur.rowcount > 0
+
+    # Deletes every entry in entry_ids in a single transaction.  Returns the number deleted.
+    def delete_entries(self, entry_ids):
+        with self.lock:
+            with self.con:
+                cur = self.con.executemany("DELETE FROM Data WHERE Id = ?", ((entry_id,) for entry_id in entry_ids))
+            return cur.rowcount
 
     # Adds a new data point to the "CabibData" table
     def new_calib_entry(self, adc, actual):
-        self.con.execute("INSERT INTO CalibData(ADC, Actual) VALUES ("+str(adc)+","+str(actual)+")")
-        self.con.commit()
+        with self.lock:
+            with self.writing():
+                self.con.execute("INSERT INTO CalibData(ADC, Actual) VALUES (?, ?)", (adc, actual))
+            for calibration in self.calibrations.values():
+                calibration.invalidate()
+
+    # Returns the calibration curve of the given polynomial degree fitted to the "CalibData" table.
+    # The fit is cached, and is only brought up to date after calibration points are added.
+    def get_calibration(self, degree=1):
+        with self.lock:
+            calibration = self.calibrations.get(degree)
+            if calibration is None:
+                calibration = self.calibrations[degree] = Calibration(self, degree)
+            return calibration
 
-    # Calculates linear regression on the "CalibData" table in the database.  Returns line as a lambda object
+    # Calculates linear regression on the "CalibData" table in the database.  Returns line as a function
     def get_line(self):
-        rows = self.get_whole_table("CalibData")
-        x = empty([len(rows)])
-        y = empty([len(rows)])
-        index = 0
-        for row in rows:
-            x[index] = row["ADC"]
-            y[index] = row["Actual"]
-            index += 1
-        slope, intercept, r_value, p_value, std_err = linregress(x,y)
-        return lambda x: slope*x + intercept
+        return self.get_calibration(1).convert
+
+    # Lazily yields tuples of the requested columns for every entry between start and end (inclusive),
+    # oldest first unless newest_first is set.  start and end may be timestamps, date strings or datetime
+    # objects, or None for no bound.  Filtering and ordering happen in sqlite on the Timestamp index, so
+    # only the matching rows are ever read.
+    def iter_range(self, start, end, columns=('Timestamp', 'Bg'), newest_first=False):
+        for column in columns:
+            if column not in RANGE_COLUMNS:
+                raise ValueError("unknown column %r" % (column,))
+        order = " ORDER BY Timestamp DESC, Id DESC" if newest_first else " ORDER BY Timestamp, Id"
+        sql = "SELECT " + ", ".join(columns) + " FROM Data WHERE Timestamp BETWEEN ? AND ?" + order
+        start = MIN_TIMESTAMP if start is None else date_to_timestamp(start)
+        end = MAX_TIMESTAMP if end is None else date_to_timestamp(end)
+        return self.iter_rows(sql, (start, end))
+
+    # Lazily yields the rows of a query as tuples, fetching chunk_size rows at a time so only one
+    # chunk is ever in memory.  The lock is only held while fetching, so writes can go in between.
+    def iter_rows(self, sql, parameters=(), chunk_size=RANGE_CHUNK_SIZE):
+        with self.lock:
+            cur = self.con.cursor()
+            cur.row_factory = None  # plain tuples are much cheaper to build than sqlite3.Row
+            cur.execute(sql, parameters)
+        while True:
+            with self.lock:
+                rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    # Lazily yields (Id, Timestamp, Bg, Carbs, Bolus, Notes) for every entry between start and end
+    # (inclusive, None for no bound) with an Id from first_id to last_id, oldest first.  Missing values
+    # are returned as 0 and missing notes as ''.
+    def iter_export(self, start=None, end=None, first_id=0, last_id=MAX_TIMESTAMP, chunk_size=EXPORT_CHUNK_SIZE):
+        start = MIN_TIMESTAMP if start is None else date_to_timestamp(start)
+        end = MAX_TIMESTAMP if end is None else date_to_timestamp(end)
+        # a narrow Id range (an incremental export) is read by Id and sorted, which beats walking the
+        # whole Timestamp index; the unary + keeps sqlite from choosing the index anyway
+        timestamp = "+Timestamp" if last_id - first_id < EXPORT_SORT_LIMIT else "Timestamp"
+        return self.iter_rows("SELECT Id, Timestamp, IFNULL(Bg, 0), IFNULL(Carbs, 0), IFNULL(Bolus, 0), IFNULL(Notes, '') "
+                              "FROM Data WHERE " + timestamp + " BETWEEN ? AND ? AND Id BETWEEN ? AND ? ORDER BY Timestamp, Id",
+                              (start, end, first_id, last_id), chunk_size)
+
+    # Returns the highest Id in the "Data" table, or 0 when it is empty
+    def last_id(self):
+        with self.lock:
+            return self.con.execute("SELECT IFNULL(MAX(Id), 0) FROM Data").fetchone()[0]
+
+    # Returns the highest Id written by the incremental export called name, or 0 if it never ran
+    def get_export_mark(self, name):
+        with self.lock:
+            row = self.con.execute("SELECT LastId FROM ExportMarks WHERE Name = ?", (name,)).fetchone()
+        return row[0] if row is not None else 0
+
+    # Records that the incremental export called name has written every entry up to last_id
+    def set_export_mark(self, name, last_id):
+        with self.lock:
+            with self.con:
+                self.con.execute("INSERT OR REPLACE INTO ExportMarks(Name, LastId, Exported) VALUES (?, ?, ?)",
+                                 (name, last_id, date_to_timestamp(datetime.datetime.now())))
+
+    # Exports the entries between start and end to path, in the given format or the one its extension
+    # implies.  With since set, only the entries added since the last export with that name are
+    # written.  Returns the number of entries written.  See data_export.py.
+    def export(self, path, fmt=None, start=None, end=None, since=None):
+        from .data_export import export
+        return export(self, path, fmt, start, end, since)
+
+    # Returns the requested numeric columns for entries between start and end as a NumPy structured array
+    def get_range_array(self, start, end, columns=('Timestamp', 'Bg')):
+        dtype = np.dtype([(column, RANGE_COLUMNS.get(column, 'O')) for column in columns])
+        if any(dtype[column].hasobject for column in columns):
+            raise ValueError("only numeric columns can be returned as an array")
+        return np.fromiter(self.iter_range(start, end, columns), dtype=dtype)
+
+    # Returns a value that changes whenever anything is written to the database, through this
+    # connection or any other, for caches of query results to check they are still current
+    def data_version(self):
+        with self.lock:
+            return self.con.total_changes, self.con.execute("PRAGMA data_version").fetchone()[0]
+
+    # Returns the Analytics engine for this database, created on first use
+    def get_analytics(self):
+        with self.lock:
+            if self.analytics is None:
+                self.analytics = Analytics(self)
+            return self.analytics
+
+    # Searches the notes for entries containing every word of text, each word matching as a prefix so
+    # results can follow typing.  Returns up to limit (Id, Timestamp, Bg, Carbs, Bolus, Notes) tuples
+    # between start and end (None for no bound), best match first when order is 'rank' or newest
+    # first when it is 'newest'.  Uses the NotesIndex full text index (ranked by bm25), or a LIKE scan
+    # without ranking when sqlite has no FTS5.
+    def search_notes(self, text, start=None, end=None, limit=SEARCH_LIMIT, order='rank'):
+        words = text.split()
+        if not words:
+            return []
+        start = MIN_TIMESTAMP if start is None else date_to_timestamp(start)
+        end = MAX_TIMESTAMP if end is None else date_to_timestamp(end)
+        columns = "Data.Id, Data.Timestamp, Data.Bg, Data.Carbs, Data.Bolus, Data.Notes"
+        if self.notes_index:
+            match = " ".join('"%s"*' % word.replace('"', '""') for word in words)
+            order_by = "NotesIndex.rank" if order == 'rank' else "Data.Timestamp DESC, Data.Id DESC"
+            sql = ("SELECT " + columns + " FROM NotesIndex JOIN Data ON Data.Id = NotesIndex.rowid "
+                   "WHERE NotesIndex MATCH ? AND Data.Timestamp BETWEEN ? AND ? ORDER BY " + order_by + " LIMIT ?")
+            parameters = [match, start, end, limit]
+        else:
+            patterns = ['%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%' for word in words]
+            sql = ("SELECT " + columns + " FROM Data WHERE Timestamp BETWEEN ? AND ? AND "
+                   + " AND ".join(["Notes LIKE ? ESCAPE '\\'"] * len(words))
+                   + " ORDER BY Timestamp DESC, Id DESC LIMIT ?")
+            parameters = [start, end] + patterns + [limit]
+        with self.lock:
+            cur = self.con.cursor()
+            cur.row_factory = None
+            return cur.execute(sql, parameters).fetchall()
+
+    # Returns the entry with the given Id from the "Data" table, or None
+    def get_entry(self, entry_id):
+        with self.lock:
+            return self.con.execute("SELECT * FROM Data WHERE Id = ?", (entry_id,)).fetchone()
+
+    # Returns the coarsest BgTiers resolution no coarser than resolution seconds, or 0 (the raw
+    # readings) when resolution is finer than every tier
+    def pick_tier(self, resolution):
+        tiers = [tier for tier in migrations.TIER_RESOLUTIONS if tier <= resolution]
+        return max(tiers) if tiers else 0
+
+    # Returns the Bg readings between start and end at a resolution of at least resolution seconds, as
+    # (tier, array).  array is a structured array of buckets with the fields Timestamp (the start of
+    # the bucket), Count, Mean, Min and Max, read from the coarsest tier that is fine enough (see
+    # pick_tier), so the cost depends on the range and resolution and not on how many entries there are.
+    # With tier 0 every reading is its own bucket.  Partial buckets at either end are included whole.
+    def get_bg_series(self, start, end, resolution=0):
+        start = MIN_TIMESTAMP if start is None else date_to_timestamp(start)
+        end = MAX_TIMESTAMP if end is None else date_to_timestamp(end)
+        tier = self.pick_tier(resolution)
+        dtype = np.dtype([('Timestamp', 'i8'), ('Count', 'i8'), ('Mean', 'f8'), ('Min', 'i4'), ('Max', 'i4')])
+        with self.lock:
+            if tier:
+                rows = self.con.execute("SELECT Bucket * Resolution, Count, Sum / Count, Min, Max FROM BgTiers "
+                                        "WHERE Resolution = ? AND Bucket BETWEEN ? AND ? ORDER BY Bucket",
+                                        (tier, start // tier, end // tier)).fetchall()
+            else:
+                rows = self.con.execute("SELECT Timestamp, 1, Bg, Bg, Bg FROM Data WHERE Timestamp BETWEEN ? AND ? "
+                                        "AND IFNULL(Bg, 0) != 0 ORDER BY Timestamp, Id", (start, end)).fetchall()
+        return tier, np.array([tuple(row) for row in rows], dtype=dtype)
+
+    # Returns summary statistics for the whole days from start to end, read from the DailyStats rollup
+    # so the cost depends on the number of days rather than the number of entries.  The result maps
+    # 'Entries' and 'Days' to counts, and 'Bg', 'Carbs' and 'Bolus' to dicts holding the count, sum,
+    # mean and standard deviation of the nonzero values of that column.
+    def get_stats(self, start, end):
+        with self.lock:
+            row = self.con.execute("SELECT COUNT(*), TOTAL(Entries), "
+                                   "TOTAL(BgCount), TOTAL(BgSum), TOTAL(BgSquares), "
+                                   "TOTAL(CarbsCount), TOTAL(CarbsSum), TOTAL(CarbsSquares), "
+                                   "TOTAL(BolusCount), TOTAL(BolusSum), TOTAL(BolusSquares) "
+                                   "FROM DailyStats WHERE Day BETWEEN ? AND ?",
+                                   (date_to_timestamp(start) // 86400, date_to_timestamp(end) // 86400)).fetchone()
+        row = tuple(row)  # sqlite3.Row can't be sliced on Python 2
+        stats = {'Days': int(row[0]), 'Entries': int(row[1])}
+        for index, column in enumerate(('Bg', 'Carbs', 'Bolus')):
+            count, total, squares = row[2 + 3*index:5 + 3*index]
+            mean = total / count if count else 0.0
+            variance = squares / count - mean*mean if count else 0.0
+            stats[column] = {'count': int(count), 'sum': total, 'mean': mean, 'std': math.sqrt(max(variance, 0.0))}
+        return stats
 
     # Returns the requested table as a dictonary object
     def get_whole_table(self, table):
-        with self.con:
-            self.con.row_factory = lite.Row
-
+        with self.lock:
             cur = self.con.cursor()
             cur.execute("SELECT * FROM " + table)
 #SELECT * FROM data ORDER BY datetime(dateColumn);
@@ -58,21 +500,20 @@ class DataManager:
 
             return cur.fetchall()
 
-    # Returns the requested table ordered by a column named datetime
+    # Returns the requested table ordered by its indexed Timestamp column
     def get_whole_table_sorted(self, table): 
-        with self.con:
-            self.con.row_factory = lite.Row
-
+        with self.lock:
             cur = self.con.cursor()
-            cur.execute("SELECT * FROM " + table + " ORDER BY datetime(dateColumn)")
+            cur.execute("SELECT * FROM " + table + " ORDER BY Timestamp")
 
 
             return cur.fetchall()
 
     # Deletes the sqlite table passed
     def delete_table(self, table):
-        cur = self.con.cursor()
-        cur.execute("DROP TABLE IF EXISTS " + table)
+        with self.lock:
+            cur = self.con.cursor()
+            cur.execute("DROP TABLE IF EXISTS " + table)
 
     # Sorts Table into chronological order TODO doesn't work
     def sort_data_table(self):
@@ -88,29 +529,15 @@ class DataManager:
 
     # Converts strings in the format m/d/y or m/d/y, h:m to a datetime object TODO depreciated
     def str_to_date(self, strdate):
-        if '/' in strdate:
-            split_date = strdate.split('/')
-            m = int(split_date[0])
-            d = int(split_date[1])
-            y = int(split_date[2])
-            h = 0
-            mins = 0
-            if y < 100:
-                y = int('20' + str(y))
+        return str_to_date(strdate)
 
-        else:
-            try:
-                dateobj = datetime.datetime.strptime( strdate, "%Y-%m-%d %H:%M" )
-                return dateobj
-            except:
-                pass
-            try:
-                dateobj = datetime.datetime.strptime( strdate, "%Y-%m-%d" )
-                return dateobj
-            except:
-                pass
-
-        return datetime.datetime(year=y, month=m, day=d, hour=h, minute=mins)
+    # Converts a date string or datetime object to the integer timestamp stored in the database
+    def date_to_timestamp(self, date):
+        return date_to_timestamp(date)
+
+    # Converts a timestamp stored in the database back to a datetime object
+    def timestamp_to_date(self, timestamp):
+        return timestamp_to_date(timestamp)
 
 # Testing stuff
 if __name__ == "__main__":
@@ -143,6 +570,7 @@ if __name__ == "__main__":
         print thing
 
     bgm.delete_table('Data')
+    bgm.con.execute("PRAGMA user_version = 0")  # let the migrations rebuild the dropped table
     bgm = DataManager()
     for point in data:
         bgm.new_entry(point[0],point[1],point[2],point[3], point[4])
@@ -1,5 +1,8 @@
 # Class for the data_screen.  Manages displaying data stored by the meter.
+# The log is shown in a RecycleView: only enough DateRow and EntryRow widgets to fill the screen are
+# created, and they are rebound to entries from self.ids.rv.data as the user scrolls.
 
+from kivy.app import App
 from kivy.clock import Clock
 from kivy.uix.screenmanager import Screen
 from kivy.uix.button import Button
@@ -7,130 +10,254 @@ from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 from kivy.core.window import Window
 from kivy.uix.boxlayout import BoxLayout
-from .data_manager import DataManager
-from kivy.properties import BooleanProperty
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from .data_manager import get_data_manager
+from .column_layout import ColumnLayout
+from kivy.properties import BooleanProperty, NumericProperty, StringProperty, ObjectProperty
 from kivy.lang import Builder
 
 Builder.load_file('kvfiles/data_screen.kv')
 
+# Date rows sort above every entry of their day, so they get the day's last second and this Id
+HEADER_ID = 2**62
+DAY = 24*60*60
+# Seconds typing has to pause before the notes are searched
+SEARCH_DELAY = 0.1
+
+# Column widths shared by every EntryRow
+entry_columns = ColumnLayout()
+
+# Text shown for a Bg, carbs or bolus value; zero means nothing was recorded
+def display_value(value):
+    if value == 0:
+        return '--'
+    return str(value)
+
+# Asks before deleting; on_delete is called if the answer is yes
 class DeleteDialoguePopup(Popup):
 
-    def __init__(self, ent, **kwargs):
+    def __init__(self, on_delete, **kwargs):
         super(DeleteDialoguePopup, self).__init__(**kwargs)
-        self.entry = ent
+        self.on_delete = on_delete
     def delete(self):
-        self.entry.delete()
+        self.on_delete()
 
-class DateRow(BoxLayout):
+class DateRow(RecycleDataViewBehavior, BoxLayout):
 
-    def __init__(self, date, **kwargs):
-        super(DateRow, self).__init__(**kwargs)
-        dm = DataManager()
-        dateobj = dm.str_to_date(date)
+    timestamp = NumericProperty(0)
+
+    def refresh_view_attrs(self, rv, index, data):
+        super(DateRow, self).refresh_view_attrs(rv, index, data)
+        dateobj = get_data_manager().timestamp_to_date(self.timestamp)
         self.ids.date.text = "%s %s, %s" % (dateobj.strftime('%B')[:3], dateobj.day, dateobj.year)
 
-class EntryRow(BoxLayout):
+class EntryRow(RecycleDataViewBehavior, BoxLayout):
 
-    widths_correct = BooleanProperty(False)
+    columns = ObjectProperty(entry_columns)
+    entry_id = NumericProperty(0)
+    timestamp = NumericProperty(0)
+    bg = NumericProperty(0)
+    carbs = NumericProperty(0)
+    bolus = NumericProperty(0)
+    notes = StringProperty('')
+    notes_width = NumericProperty(0)
+    selected = BooleanProperty(False)
 
-    def __init__(self, date, time, b, c, bo, n, **kwargs):
+    def __init__(self, **kwargs):
         super(EntryRow, self).__init__(**kwargs)
+        self.dm = get_data_manager()
+        self.rv = None
 
-        self.dm = DataManager()
-        self.datetime = date + ' ' + time
-        self.bg = b
-        self.carbs = c
-        self.bolus = bo
-        self.notes = n
-
-        i = self.ids
-        i.time.text = time
-        if b == 0:
-            i.bg.text = '--'
-        else:
-            i.bg.text = str(b)
-        if c == 0:
-            i.carbs.text = '--'
-        else:
-            i.carbs.text = str(c)
-        if bo == 0:
-            i.bolus.text = '--'
-        else:
-            i.bolus.text = str(bo)
-        i.notes.text = n
+    # Called by the RecycleView whenever this widget is bound to a different entry.  Column widths
+    # come from the shared ColumnLayout, so the only measuring left is a cached lookup for the notes.
+    def refresh_view_attrs(self, rv, index, data):
+        super(EntryRow, self).refresh_view_attrs(rv, index, data)
+        self.rv = rv
+        dateobj = self.dm.timestamp_to_date(self.timestamp)
 
-    def refresh_widths(self):
         i = self.ids
-        i.bg._label.refresh()      # have to refresh to update texture size
-        i.carbs._label.refresh()
-        i.bolus._label.refresh()
-        i.notes._label.refresh()
-        i.layout.width = sum(x.width for x in self.ids.layout.children)
-        totalwidth = i.layout.width + i.time.width
-        print totalwidth
-        if totalwidth < (Window.width + i.deletebtn.width + i.editbtn.width):
-            i.spacer.width = Window.width - totalwidth + i.deletebtn.width + i.editbtn.width
-            self.refresh_widths()
+        i.scroll.scroll_x = 0
+        i.time.text = dateobj.strftime('%H:%M')
+        i.bg.text = display_value(self.bg)
+        i.carbs.text = display_value(self.carbs)
+        i.bolus.text = display_value(self.bolus)
+        i.notes.text = self.notes
+        self.notes_width = self.columns.text_width(self.notes)
 
     def open_delete_dialogue_popup(self):
-        popup = DeleteDialoguePopup(self)
+        popup = DeleteDialoguePopup(self.delete)
         popup.open()
 
+    def open_edit_popup(self):
+        App.get_running_app().open_new_entry_popup([self.entry_id])
+
+    def toggle_selected(self):
+        if self.rv is not None:
+            self.selected = self.rv.screen.toggle_selected(self.entry_id, self.timestamp)
+
     def delete(self):
-        self.dm.delete_entry(self.datetime, int(self.bg), int(self.carbs), int(self.bolus), self.notes)
+        self.dm.delete_entry(self.entry_id)
+        if self.rv is not None:
+            if self.selected:
+                self.rv.screen.toggle_selected(self.entry_id, self.timestamp)
+            self.rv.screen.remove_entry(self.entry_id, self.timestamp)
 
 class DataScreen(Screen):
 
+    selection_count = NumericProperty(0)
+
     def __init__(self, **kwargs):
         super(DataScreen, self).__init__(**kwargs)
 
-        self.dm = DataManager()
-        self.entryrows = []
-        self.daterows = []
+        self.dm = get_data_manager()
+        # Timestamps of the selected entries, by Id
+        self.selected = {}
         self.render_data()
 
-        Clock.schedule_once(self.update_row_widths, 8)
-        #self.refresh()
+    # Returns the data dict describing one entry
+    def entry_data(self, entry_id, timestamp, bg, carbs, bolus, notes):
+        return {'viewclass': 'EntryRow', 'entry_id': entry_id, 'timestamp': timestamp,
+                'bg': bg, 'carbs': carbs, 'bolus': bolus, 'notes': notes or '', 'selected': entry_id in self.selected}
+
+    # Returns the data dict for the date row heading the day containing timestamp
+    def date_data(self, timestamp):
+        return {'viewclass': 'DateRow', 'entry_id': HEADER_ID, 'timestamp': timestamp - timestamp % DAY + DAY - 1}
 
+    # Builds the data for the whole log, newest first, with a date row above each day.  No widgets are
+    # created here; the RecycleView binds rows to its widget pool as they scroll into view.
     def render_data(self):
-        layout = self.ids.layout
+        self.show_rows(self.dm.iter_range(None, None, ('Id', 'Timestamp', 'Bg', 'Carbs', 'Bolus', 'Notes'), newest_first=True))
+
+    # Shows (Id, Timestamp, Bg, Carbs, Bolus, Notes) rows, which must be newest first
+    def show_rows(self, rows):
+        self.clear_selection()
+        data = []
+        lastday = None
+        bgs, carbs_values, boluses = set(), set(), set()
+        for entry_id, timestamp, bg, carbs, bolus, notes in rows:
+            day = timestamp // DAY
+            if day != lastday:
+                lastday = day
+                data.append(self.date_data(timestamp))
+            data.append(self.entry_data(entry_id, timestamp, bg, carbs, bolus, notes))
+            bgs.add(bg)
+            carbs_values.add(carbs)
+            boluses.add(bolus)
+        entry_columns.compute({'bg': map(display_value, bgs),
+                                'carbs': map(display_value, carbs_values),
+                                'bolus': map(display_value, boluses)})
+        self.ids.rv.data = data
 
-        rows = self.dm.get_whole_table_sorted("data")
+    # Binary searches the newest first data for the index of (timestamp, entry_id), or where it would go
+    def find_index(self, timestamp, entry_id):
+        data = self.ids.rv.data
+        key = (timestamp, entry_id)
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (data[mid]['timestamp'], data[mid]['entry_id']) > key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
 
-        lastdate = ""
-        rows.reverse()
-        for row in rows:
-            isodate = row["dateColumn"]
-            isodate_split = isodate.split(' ')
-            date = isodate_split[0]
-            time = isodate_split[1]
+    # Whether the list is showing search results rather than the whole log
+    def searching(self):
+        return bool(self.ids.search.text.split())
 
-            if date != lastdate:
-                lastdate = date
-                daterow = DateRow(date)
-                layout.add_widget(daterow)
-                self.daterows.append(daterow)
+    # Called as the search box is edited; searches once typing pauses
+    def search_changed(self, text):
+        Clock.unschedule(self.search)
+        Clock.schedule_once(self.search, SEARCH_DELAY)
 
-            bg = row['Bg']
-            carbs = row['Carbs']
-            bolus = row['bolus']
-            notes = row['Notes']
+    # Shows the entries whose notes match the search box, newest first, or the whole log when it's empty
+    def search(self, *args):
+        if self.searching():
+            self.show_rows(self.dm.search_notes(self.ids.search.text, order='newest'))
+        else:
+            self.render_data()
 
-            entry = EntryRow(date, time, bg, carbs, bolus, notes)
-            layout.add_widget(entry)
-            self.entryrows.append(entry)
+    # Inserts a newly added entry into the list without rebuilding it
+    def add_entry(self, entry_id):
+        if self.searching():
+            self.search()  # the new entry only belongs in the list if it matches
+            return
+        row = self.dm.get_entry(entry_id)
+        if row is None:
+            return
+        data = self.ids.rv.data
+        timestamp = row['Timestamp']
+        if entry_id in self.selected:
+            self.selected[entry_id] = timestamp  # it may have been edited
+        header = self.date_data(timestamp)
+        index = self.find_index(header['timestamp'], header['entry_id'])
+        if index >= len(data) or data[index]['viewclass'] != 'DateRow' or data[index]['timestamp'] != header['timestamp']:
+            data.insert(index, header)
+        index = self.find_index(timestamp, entry_id)
+        data.insert(index, self.entry_data(entry_id, timestamp, row['Bg'], row['Carbs'], row['Bolus'], row['Notes']))
+        entry_columns.fit('bg', display_value(row['Bg']))
+        entry_columns.fit('carbs', display_value(row['Carbs']))
+        entry_columns.fit('bolus', display_value(row['Bolus']))
 
-    def refresh(self, *args):
-        for entry in self.entryrows:
-            self.ids.layout.remove_widget(entry)
-        for date in self.daterows:
-            self.ids.layout.remove_widget(date)
+    # Removes a deleted entry from the list, along with its date row if the day is now empty
+    def remove_entry(self, entry_id, timestamp):
+        data = self.ids.rv.data
+        index = self.find_index(timestamp, entry_id)
+        if index >= len(data) or data[index]['entry_id'] != entry_id:
+            return
+        data.pop(index)
+        last_of_day = index >= len(data) or data[index]['viewclass'] == 'DateRow'
+        if last_of_day and data[index - 1]['viewclass'] == 'DateRow':
+            data.pop(index - 1)
 
-        self.entryrows = []
-        self.render_data()
-        Clock.schedule_once(self.update_row_widths, 0.5)
+    # Re-reads entries that were edited, given their timestamps before the edit by Id, and moves them
+    # to where they now belong.  Nothing else in the list is rebuilt.
+    def update_entries(self, old_timestamps):
+        if self.searching():
+            self.search()  # an edit can change whether an entry matches
+            return
+        for entry_id, timestamp in old_timestamps.items():
+            self.remove_entry(entry_id, timestamp)
+            self.add_entry(entry_id)
 
-    def update_row_widths(self, *args):
-        for entry in self.entryrows:
-            entry.refresh_widths()
+    # Selects or deselects an entry for the batch edit and delete.  Returns whether it is now selected.
+    def toggle_selected(self, entry_id, timestamp):
+        if entry_id in self.selected:
+            del self.selected[entry_id]
+        else:
+            self.selected[entry_id] = timestamp
+        data = self.ids.rv.data
+        index = self.find_index(timestamp, entry_id)
+        if index < len(data) and data[index]['entry_id'] == entry_id:
+            data[index]['selected'] = entry_id in self.selected  # no dispatch needed; the row updates itself
+        self.selection_count = len(self.selected)
+        return entry_id in self.selected
+
+    def clear_selection(self):
+        if not self.selected:
+            return
+        data = self.ids.rv.data
+        for entry_id, timestamp in self.selected.items():
+            index = self.find_index(timestamp, entry_id)
+            if index < len(data) and data[index]['entry_id'] == entry_id:
+                data[index]['selected'] = False
+        self.selected = {}
+        self.selection_count = 0
+        self.ids.rv.refresh_from_data()
+
+    def open_edit_selected_popup(self):
+        App.get_running_app().open_new_entry_popup(list(self.selected))
 
+    def open_delete_selected_popup(self):
+        DeleteDialoguePopup(self.delete_selected).open()
+
+    # Deletes every selected entry in one transaction and removes just those rows from the list
+    def delete_selected(self):
+        selected = self.selected
+        self.dm.delete_entries(list(selected))
+        self.clear_selection()
+        for entry_id, timestamp in selected.items():
+            self.remove_entry(entry_id, timestamp)
+
+    def refresh(self, *args):
+        self.search()
@@ -12,7 +12,6 @@ from kivy.resources import resource_find
 from kivy.graphics import Color, BorderImage, Canvas, Line, Rectangle
 from kivy.core.image import Image
 
-from .data_manager import DataManager
 from kivy.lang import Builder
 from kivy.properties import ListProperty
 
@@ -20,7 +19,8 @@ from math import sin
 from kivy.garden.graph import Graph, MeshLinePlot
 import datetime
 
-from classes.data_manager import DataManager
+from classes.data_manager import get_data_manager
+from classes.plotting import SeriesPlot
 
 Builder.load_file('kvfiles/home_screen.kv')
 
@@ -36,12 +36,15 @@ from classes.datetime_picker_popup import DatetimePickerPopup
 #from matplotlib.figure import Figure
 import numpy as np
 
+DAY = 24*60*60
+
 class HomeScreen(Screen):
     def __init__(self, **kwargs):
 
         super(HomeScreen, self).__init__(**kwargs)
 
-        self.dm = DataManager()
+        self.dm = get_data_manager()
+        self.bg_plot = None
         '''
         negday = datetime.timedelta(days=-1)
         today = datetime.date.today()
@@ -96,51 +99,31 @@ class HomeScreen(Screen):
             upper_bound = self.dm.str_to_date(self.endbtn.text)
             lower_bound = self.dm.str_to_date(self.beginbtn.text)
 
-        if lower_bound.day >= 10:
-            ids.graphid.xmin = int(str(lower_bound.month) + str(lower_bound.day))
-        else:
-            ids.graphid.xmin = int(str(lower_bound.month) + '0' + str(lower_bound.day))
-        if upper_bound.day >= 10:
-            ids.graphid.xmax = int(str(upper_bound.month) + str(upper_bound.day))
-        else:
-            ids.graphid.xmax = int(str(upper_bound.month) + '0' + str(upper_bound.day))
-
-
-        print ids.graphid.xmax
-        print ids.graphid.xmin
-        plot = MeshLinePlot(color=[.1, .7, 1, 1])
-        #plot.points = [(x, 30*sin(x / 10.)+100+(x)) for x in range(0, 101)]
-        rows = self.dm.get_whole_table("data")
-        result = []
-        carbavg = 0
-        bgavg = 0
-        dev = 0
-        for row in rows:
-            date = self.dm.str_to_date(row["dateColumn"])
-            if date >= lower_bound and date <= upper_bound:
-                carbavg += row["Carbs"]
-                bgavg += row["Bg"]
-                dev = 10
-                result.append(row)
-        rows = result
-        if len(rows) > 0:
-            ids.average_lbl.text = str(bgavg/len(rows))
-            ids.deviation_lbl.text = "±" + str(dev/len(rows))
-            ids.carbs_lbl.text = str(carbavg/len(rows))
-
-
-
-        #plot.points =[(int(str(self.dm.str_to_date(row["Date"]).month)+str(self.dm.str_to_date(row["Date"]).day)), row["Bg"]) for row in rows]
-        for row in rows:
-            date = self.dm.str_to_date(row["dateColumn"])
-            if date.day >= 10:
-                dateint = int(str(date.month)+str(date.day))
-            else:
-                dateint = int(str(date.month) + '0' + str(date.day))
-            point = (dateint, row["Bg"])
-            plot.points.append(point)
-
-        ids.graphid.add_plot(plot)
+        # the x axis is days since the start of the range, from the entries' real timestamps
+        start = self.dm.date_to_timestamp(lower_bound)
+        # the end date is a whole day, so include everything up to its last second
+        end = self.dm.date_to_timestamp(upper_bound) + DAY - 1
+        ids.graphid.xmin = 0
+        ids.graphid.xmax = float(end + 1 - start) / DAY
+
+        stats = self.dm.get_stats(lower_bound, upper_bound)
+        if stats['Entries'] > 0:
+            ids.average_lbl.text = str(int(round(stats['Bg']['mean'])))
+            ids.deviation_lbl.text = "±" + str(int(round(stats['Bg']['std'])))
+            ids.carbs_lbl.text = str(int(round(stats['Carbs']['sum'] / stats['Days'])))
+        analytics = self.dm.get_analytics().get(start, end)
+        if analytics['readings'] > 0:
+            ids.in_range_lbl.text = "%d%%" % round(100 * analytics['time_in_range']['in range'])
+
+        # one bucket per pixel is as fine as the graph can show, so read the coarsest tier that gives that
+        tier, buckets = self.dm.get_bg_series(start, end, float(end + 1 - start) / max(ids.graphid.width, 1))
+        # draw each bucket's range as its min and max at the bucket's middle
+        middle = (buckets['Timestamp'] + tier / 2.0 - start) / DAY
+        x = np.repeat(middle, 2)
+        y = np.column_stack((buckets['Min'], buckets['Max'])).ravel()
+        if self.bg_plot is None:
+            self.bg_plot = SeriesPlot(ids.graphid, color=[.1, .7, 1, 1])
+        self.bg_plot.set_data(x, y)
     def test_keyboard(self):
 
        from kivy.base import runTouchApp
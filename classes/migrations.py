@@ -0,0 +1,201 @@
+# Versioned schema migrations for data.db.  The schema version is kept in sqlite's user_version pragma,
+# and every migration whose version is newer than the file's is applied in order inside a transaction.
+# Run directly to upgrade a database file in place:  python -m classes.migrations [path/to/data.db]
+
+import sys
+import sqlite3 as lite
+
+# Version 1: the original tables, as created by older releases of the meter
+def create_base_tables(cur):
+    # Table for storing date, time, blood glucose value, carbs, bolus, and notes
+    cur.execute("CREATE TABLE IF NOT EXISTS Data(Id INTEGER PRIMARY KEY, DateColumn date, Bg INT, Carbs INT, Bolus INT, Notes Text)")
+    # Table for storing points with which to calibrate the meter.
+    cur.execute("CREATE TABLE IF NOT EXISTS CalibData(ADC INT, Actual INT)")
+
+# Version 2: replaces the free text DateColumn with integer epoch seconds and indexes it, so sorted
+# scans and range queries walk the index instead of sorting on datetime(DateColumn) every time.
+def add_timestamp_column(cur):
+    from .data_manager import date_to_timestamp
+
+    def convert(strdate):
+        try:
+            return date_to_timestamp(strdate)
+        except (ValueError, TypeError, IndexError, UnboundLocalError):
+            return 0  # unparseable dates are kept, sorted to the start of the log
+    cur.connection.create_function('to_timestamp', 1, convert)
+
+    cur.execute("CREATE TABLE Data_v2(Id INTEGER PRIMARY KEY, Timestamp INTEGER NOT NULL, Bg INT, Carbs INT, Bolus INT, Notes Text)")
+    cur.execute("INSERT INTO Data_v2(Id, Timestamp, Bg, Carbs, Bolus, Notes) SELECT Id, to_timestamp(DateColumn), Bg, Carbs, Bolus, Notes FROM Data")
+    cur.execute("DROP TABLE Data")
+    cur.execute("ALTER TABLE Data_v2 RENAME TO Data")
+    cur.execute("CREATE INDEX IF NOT EXISTS Data_Timestamp ON Data(Timestamp)")
+
+# Version 3: a DailyStats rollup holding count, sum and sum of squares of Bg, Carbs and Bolus per day,
+# so means and deviations over any range come from one row per day instead of one row per entry.
+# Zero means "not recorded" in the Data table, so only nonzero values are counted.  Triggers keep it
+# in step with every insert, delete and edit, inside the same transaction as the change itself.
+def add_daily_stats(cur):
+    cur.execute("CREATE TABLE DailyStats(Day INTEGER PRIMARY KEY, Entries INTEGER NOT NULL DEFAULT 0, "
+                "BgCount INTEGER NOT NULL DEFAULT 0, BgSum REAL NOT NULL DEFAULT 0, BgSquares REAL NOT NULL DEFAULT 0, "
+                "CarbsCount INTEGER NOT NULL DEFAULT 0, CarbsSum REAL NOT NULL DEFAULT 0, CarbsSquares REAL NOT NULL DEFAULT 0, "
+                "BolusCount INTEGER NOT NULL DEFAULT 0, BolusSum REAL NOT NULL DEFAULT 0, BolusSquares REAL NOT NULL DEFAULT 0)")
+
+    # Builds the assignments adding (sign '+') or removing (sign '-') the NEW or OLD row from its day
+    def update_day(row, sign):
+        assignments = ["Entries = Entries %s 1" % sign]
+        for column in ('Bg', 'Carbs', 'Bolus'):
+            value = "IFNULL(%s.%s, 0)" % (row, column)
+            assignments.append("%sCount = %sCount %s (%s != 0)" % (column, column, sign, value))
+            assignments.append("%sSum = %sSum %s %s" % (column, column, sign, value))
+            assignments.append("%sSquares = %sSquares %s %s*%s" % (column, column, sign, value, value))
+        return "UPDATE DailyStats SET %s WHERE Day = %s.Timestamp / 86400" % (", ".join(assignments), row)
+    add = update_day('NEW', '+')
+    remove = update_day('OLD', '-')
+
+    cur.execute("CREATE TRIGGER DailyStats_insert AFTER INSERT ON Data BEGIN "
+                "INSERT OR IGNORE INTO DailyStats(Day) VALUES (NEW.Timestamp / 86400); "
+                + add + "; END")
+    cur.execute("CREATE TRIGGER DailyStats_delete AFTER DELETE ON Data BEGIN "
+                + remove + "; "
+                "DELETE FROM DailyStats WHERE Day = OLD.Timestamp / 86400 AND Entries <= 0; END")
+    cur.execute("CREATE TRIGGER DailyStats_update AFTER UPDATE OF Timestamp, Bg, Carbs, Bolus ON Data BEGIN "
+                + remove + "; "
+                "DELETE FROM DailyStats WHERE Day = OLD.Timestamp / 86400 AND Entries <= 0; "
+                "INSERT OR IGNORE INTO DailyStats(Day) VALUES (NEW.Timestamp / 86400); "
+                + add + "; END")
+    cur.execute("INSERT INTO DailyStats SELECT Timestamp / 86400, COUNT(*), "
+                "SUM(IFNULL(Bg, 0) != 0), TOTAL(Bg), TOTAL(Bg*Bg), "
+                "SUM(IFNULL(Carbs, 0) != 0), TOTAL(Carbs), TOTAL(Carbs*Carbs), "
+                "SUM(IFNULL(Bolus, 0) != 0), TOTAL(Bolus), TOTAL(Bolus*Bolus) "
+                "FROM Data GROUP BY Timestamp / 86400")
+
+# Version 4: a cache of fitted calibration curves, so the ADC to mg/dL model survives restarts and is
+# only refit when CalibData changes.  Moments holds the least squares normal equations as JSON so new
+# calibration points can be folded in without rereading the old ones.
+def add_calibration_fit(cur):
+    cur.execute("CREATE TABLE CalibFit(Degree INTEGER PRIMARY KEY, LastRowid INTEGER NOT NULL, Points INTEGER NOT NULL, "
+                "Moments TEXT NOT NULL, Coefficients TEXT NOT NULL)")
+
+# Bucket sizes in seconds of the BgTiers aggregates: hourly, daily and weekly
+TIER_RESOLUTIONS = (3600, 86400, 7 * 86400)
+
+# Version 5: BgTiers, hourly, daily and weekly aggregates (count, sum, min and max) of the nonzero Bg
+# readings, so a graph spanning years reads a few thousand buckets instead of every entry.  Triggers
+# keep every tier current on insert, delete and edit.  Removing a reading can't be undone from the
+# aggregate alone, so the bucket's min and max are recomputed from its rows through the Timestamp index.
+def add_bg_tiers(cur):
+    cur.execute("CREATE TABLE BgTiers(Resolution INTEGER NOT NULL, Bucket INTEGER NOT NULL, Count INTEGER NOT NULL, "
+                "Sum REAL NOT NULL, Min INTEGER NOT NULL, Max INTEGER NOT NULL, PRIMARY KEY (Resolution, Bucket))")
+
+    # Builds the statements adding the NEW row's reading to every tier
+    def add(row):
+        statements = []
+        for resolution in TIER_RESOLUTIONS:
+            bucket = "%s.Timestamp / %d" % (row, resolution)
+            where = "Resolution = %d AND Bucket = %s AND IFNULL(%s.Bg, 0) != 0" % (resolution, bucket, row)
+            statements.append("INSERT OR IGNORE INTO BgTiers SELECT %d, %s, 0, 0, %s.Bg, %s.Bg WHERE IFNULL(%s.Bg, 0) != 0"
+                              % (resolution, bucket, row, row, row))
+            statements.append("UPDATE BgTiers SET Count = Count + 1, Sum = Sum + %s.Bg, Min = MIN(Min, %s.Bg), "
+                              "Max = MAX(Max, %s.Bg) WHERE %s" % (row, row, row, where))
+        return "; ".join(statements)
+
+    # Builds the statements removing the OLD row's reading from every tier
+    def remove(row):
+        statements = []
+        for resolution in TIER_RESOLUTIONS:
+            bucket = "%s.Timestamp / %d" % (row, resolution)
+            where = "Resolution = %d AND Bucket = %s AND IFNULL(%s.Bg, 0) != 0" % (resolution, bucket, row)
+            remaining = ("FROM Data WHERE Timestamp BETWEEN %s * %d AND %s * %d + %d AND IFNULL(Bg, 0) != 0"
+                         % (bucket, resolution, bucket, resolution, resolution - 1))
+            statements.append("UPDATE BgTiers SET Count = Count - 1, Sum = Sum - %s.Bg, Min = IFNULL((SELECT MIN(Bg) %s), 0), "
+                              "Max = IFNULL((SELECT MAX(Bg) %s), 0) WHERE %s" % (row, remaining, remaining, where))
+            statements.append("DELETE FROM BgTiers WHERE %s AND Count <= 0" % where)
+        return "; ".join(statements)
+
+    cur.execute("CREATE TRIGGER BgTiers_insert AFTER INSERT ON Data BEGIN " + add('NEW') + "; END")
+    cur.execute("CREATE TRIGGER BgTiers_delete AFTER DELETE ON Data BEGIN " + remove('OLD') + "; END")
+    cur.execute("CREATE TRIGGER BgTiers_update AFTER UPDATE OF Timestamp, Bg ON Data BEGIN "
+                + remove('OLD') + "; " + add('NEW') + "; END")
+    for resolution in TIER_RESOLUTIONS:
+        cur.execute("INSERT INTO BgTiers SELECT %d, Timestamp / %d, COUNT(*), TOTAL(Bg), MIN(Bg), MAX(Bg) "
+                    "FROM Data WHERE IFNULL(Bg, 0) != 0 GROUP BY Timestamp / %d" % (resolution, resolution, resolution))
+
+# Version 6: ExportMarks, the highest Id each named incremental export has written, so the next
+# export with that name only writes the entries added since.  Ids are reused when the newest entry is
+# deleted, so a trigger moves back any mark past the deleted entry, or the entry replacing it would
+# never be exported.
+def add_export_marks(cur):
+    cur.execute("CREATE TABLE ExportMarks(Name TEXT PRIMARY KEY, LastId INTEGER NOT NULL, Exported INTEGER NOT NULL)")
+    cur.execute("CREATE TRIGGER ExportMarks_delete AFTER DELETE ON Data WHEN OLD.Id > IFNULL((SELECT MAX(Id) FROM Data), 0) BEGIN "
+                "UPDATE ExportMarks SET LastId = OLD.Id - 1 WHERE LastId >= OLD.Id; END")
+
+# Version 7: NotesIndex, an FTS5 full text index of the Notes column.  It is an external content
+# index reading the text from Data itself, so notes aren't stored twice, and triggers keep it in step
+# with every insert, delete and edit.  Prefixes of up to three characters are indexed too, so
+# search as you type stays fast on the first letters.  sqlite builds without FTS5 get no index, and
+# DataManager.search_notes falls back to a LIKE scan.
+def add_notes_index(cur):
+    try:
+        cur.execute("CREATE VIRTUAL TABLE NotesIndex USING fts5(Notes, content='Data', content_rowid='Id', prefix='1 2 3')")
+    except lite.OperationalError:
+        return  # no FTS5 module
+    cur.execute("CREATE TRIGGER NotesIndex_insert AFTER INSERT ON Data BEGIN "
+                "INSERT INTO NotesIndex(rowid, Notes) VALUES (NEW.Id, NEW.Notes); END")
+    cur.execute("CREATE TRIGGER NotesIndex_delete AFTER DELETE ON Data BEGIN "
+                "INSERT INTO NotesIndex(NotesIndex, rowid, Notes) VALUES ('delete', OLD.Id, OLD.Notes); END")
+    cur.execute("CREATE TRIGGER NotesIndex_update AFTER UPDATE OF Notes ON Data BEGIN "
+                "INSERT INTO NotesIndex(NotesIndex, rowid, Notes) VALUES ('delete', OLD.Id, OLD.Notes); "
+                "INSERT INTO NotesIndex(rowid, Notes) VALUES (NEW.Id, NEW.Notes); END")
+    cur.execute("INSERT INTO NotesIndex(NotesIndex) VALUES ('rebuild')")
+
+# Ordered list of (version, migration).  Append new migrations here; never edit an applied one.
+MIGRATIONS = [
+    (1, create_base_tables),
+    (2, add_timestamp_column),
+    (3, add_daily_stats),
+    (4, add_calibration_fit),
+    (5, add_bg_tiers),
+    (6, add_export_marks),
+    (7, add_notes_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Returns the schema version stored in the database
+def schema_version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+# Brings the database up to the latest schema version.  Returns the (old, new) versions.
+def migrate(con):
+    old_version = schema_version(con)
+    if old_version >= SCHEMA_VERSION:
+        return old_version, old_version
+    # Take manual control of the transaction so table rebuilds are atomic; the sqlite3 module
+    # would otherwise commit implicitly around the DDL statements.
+    isolation_level = con.isolation_level
+    con.isolation_level = None
+    cur = con.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        for version, migration in MIGRATIONS:
+            if version > old_version:
+                migration(cur)
+                cur.execute("PRAGMA user_version = %d" % version)
+        cur.execute("COMMIT")
+    except:
+        cur.execute("ROLLBACK")
+        raise
+    finally:
+        con.isolation_level = isolation_level
+    return old_version, SCHEMA_VERSION
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or ['data.db']
+    for path in paths:
+        con = lite.connect(path)
+        old_version, new_version = migrate(con)
+        con.close()
+        if old_version == new_version:
+            print("%s: already at schema version %d" % (path, new_version))
+        else:
+            print("%s: upgraded schema version %d -> %d" % (path, old_version, new_version))
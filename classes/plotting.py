@@ -0,0 +1,60 @@
+# Plotting helpers for the garden Graph.  Each series keeps one MeshLinePlot for its lifetime and
+# only its points change, so redraws never pile up plots.  Points are decimated to the graph's
+# width: every pixel column keeps only its lowest and highest point, which draws the same line as
+# the full data (spikes included) with at most two points per column, however long the range is.
+
+import numpy as np
+
+from kivy.garden.graph import MeshLinePlot
+
+# Returns the indices of the points of (x, y) to draw in a plot columns pixels wide spanning xmin
+# to xmax: the lowest and highest point in each column, in x order.  x must be sorted, so each
+# column's points are a contiguous run and everything is done with reduceat over the runs.
+def minmax_indices(x, y, xmin, xmax, columns):
+    if len(x) <= 2 * columns or xmax <= xmin:
+        return np.arange(len(x))
+    y = np.asarray(y)
+    edges = xmin + (xmax - xmin) * np.arange(1, columns) / float(columns)
+    starts = np.concatenate(([0], np.searchsorted(x, edges)))
+    starts = np.unique(starts[starts < len(x)])  # drop empty columns
+    counts = np.diff(np.append(starts, len(x)))
+    run = np.repeat(np.arange(len(starts)), counts)
+    picked = [first_in_run(np.flatnonzero(np.repeat(extreme.reduceat(y, starts), counts) == y), run)
+              for extreme in (np.minimum, np.maximum)]
+    return np.unique(np.concatenate(picked))
+
+# Returns the first of the sorted indices in each run
+def first_in_run(indices, run):
+    runs = run[indices]
+    return indices[np.concatenate(([True], runs[1:] != runs[:-1]))]
+
+# Returns (x, y) decimated with minmax_indices
+def decimate(x, y, xmin, xmax, columns):
+    indices = minmax_indices(x, y, xmin, xmax, columns)
+    return np.asarray(x)[indices], np.asarray(y)[indices]
+
+# One line on a Graph.  set_data stores the full series; the plot's points are rebuilt from it,
+# decimated to the graph's current width, whenever the data, x range or size of the graph changes.
+class SeriesPlot:
+
+    def __init__(self, graph, color=(.1, .7, 1, 1)):
+        self.graph = graph
+        self.plot = MeshLinePlot(color=list(color))
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        graph.add_plot(self.plot)
+        graph.bind(width=self.redraw, xmin=self.redraw, xmax=self.redraw)
+
+    def set_data(self, x, y):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.redraw()
+
+    def redraw(self, *args):
+        graph = self.graph
+        x, y = decimate(self.x, self.y, graph.xmin, graph.xmax, max(int(graph.width), 1))
+        self.plot.points = list(zip(x.tolist(), y.tolist()))
+
+    def remove(self):
+        self.graph.unbind(width=self.redraw, xmin=self.redraw, xmax=self.redraw)
+        self.graph.remove_plot(self.plot)
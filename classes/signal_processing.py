@@ -0,0 +1,106 @@
+# Streaming signal processing for strip and sample detection.  Samples arrive as (times, values) NumPy
+# blocks of bounded size; the filters are generators that carry only their last window of samples
+# from one block to the next, and the detectors keep a counter or a short window of state, so memory
+# stays constant however long the stream runs.  Each block is processed with vectorized NumPy.
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Returns a read only (len(values) - window + 1, window) view of the sliding windows over values
+def sliding_windows(values, window):
+    values = np.ascontiguousarray(values)
+    count = len(values) - window + 1
+    stride = values.strides[0]
+    return as_strided(values, shape=(max(count, 0), window), strides=(stride, stride))
+
+# Yields each block with every value replaced by the median of it and the window - 1 values before it.
+# The median rejects single sample spikes, such as the alternating 30, 10, 30, 15 noise in the traces.
+def median_filter(blocks, window=5):
+    history = None
+    for times, values in blocks:
+        if not len(values):
+            continue
+        values = np.asarray(values, dtype=float)
+        if history is None:
+            history = np.repeat(values[0], window - 1)
+        extended = np.concatenate((history, values))
+        filtered = np.median(sliding_windows(extended, window), axis=1)
+        history = extended[len(extended) - (window - 1):]
+        yield times, filtered
+
+# Yields each block with every value replaced by the mean of it and the window - 1 values before it
+def moving_average(blocks, window=5):
+    history = None
+    for times, values in blocks:
+        if not len(values):
+            continue
+        values = np.asarray(values, dtype=float)
+        if history is None:
+            history = np.repeat(values[0], window - 1)
+        extended = np.concatenate((history, values))
+        sums = np.cumsum(np.concatenate(([0.0], extended)))
+        filtered = (sums[window:] - sums[:-window]) / window
+        history = extended[len(extended) - (window - 1):]
+        yield times, filtered
+
+# Debounced threshold detector.  find reports where the signal has been above (or below) threshold
+# for count consecutive samples, so a single noisy sample can never trigger it.  The length of the
+# run in progress is carried between blocks.
+class Debouncer:
+
+    def __init__(self, threshold, count=3, above=True):
+        self.threshold = threshold
+        self.count = count
+        self.above = above
+        self.run = 0
+
+    def reset(self):
+        self.run = 0
+
+    # Returns the index in values at which the condition has held for count samples, or None.  Only
+    # the samples up to that index are consumed; pass the rest of the block in again to keep going.
+    def find(self, values):
+        if self.above:
+            matches = np.asarray(values) > self.threshold
+        else:
+            matches = np.asarray(values) < self.threshold
+        if not len(matches):
+            return None
+        indices = np.arange(len(matches))
+        # index of the most recent failing sample at or before each sample; runs carried in from the
+        # previous block count as failing samples before the start of this one
+        last_failure = np.maximum.accumulate(np.where(matches, -1 - self.run, indices))
+        runs = indices - last_failure
+        found = np.flatnonzero(runs >= self.count)
+        if len(found):
+            self.run = 0
+            return int(found[0])
+        self.run = int(runs[-1])
+        return None
+
+# Detects when a signal has settled: the spread (max - min) of the last window samples is at most
+# tolerance.  The last window - 1 samples are carried between blocks.
+class SettleDetector:
+
+    def __init__(self, window=10, tolerance=50):
+        self.window = window
+        self.tolerance = tolerance
+        self.history = np.empty(0)
+
+    def reset(self):
+        self.history = np.empty(0)
+
+    # Returns the index in values at which the signal has settled, or None.  Samples up to that
+    # index are consumed.
+    def find(self, values):
+        values = np.asarray(values, dtype=float)
+        carried = len(self.history)
+        extended = np.concatenate((self.history, values))
+        windows = sliding_windows(extended, self.window)
+        found = np.flatnonzero(windows.max(axis=1) - windows.min(axis=1) <= self.tolerance) if len(windows) else []
+        if len(found):
+            self.reset()
+            # the window starting at found[0] ends on this sample of the block
+            return int(found[0]) + self.window - 1 - carried
+        self.history = extended[max(len(extended) - (self.window - 1), 0):]
+        return None
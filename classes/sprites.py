@@ -0,0 +1,42 @@
+# Texture atlases for the app's images.  The UI images and the FlappyBird sprites are each packed
+# into one texture (res/atlas/*.atlas and *-0.png) when the app is built, and every image is a region
+# of it, so switching sprite frames only points a widget at a different region of a texture that is
+# already on the GPU.  Atlases are loaded once by preload and shared with Kivy's own atlas:// loader,
+# so kv files referring to atlas://res/atlas/<name>/<image> reuse the same textures.
+# Rebuild the atlases after changing an image, from the repository root:  python -m classes.sprites
+
+from kivy.atlas import Atlas
+from kivy.cache import Cache
+
+ATLAS_DIR = 'res/atlas'
+UI_ATLAS = ATLAS_DIR + '/ui'
+FLAPPY_ATLAS = ATLAS_DIR + '/flappy'
+ATLAS_SIZE = 1024
+
+# Images packed into each atlas.  Each is named in the atlas by its file name without the extension.
+ATLAS_SOURCES = {
+    UI_ATLAS: ['res/background.png', 'res/blood.png'],
+    FLAPPY_ATLAS: ['res/images/background.png', 'res/images/flappy.png', 'res/images/flappynormal.png',
+                   'res/images/flappyup.png', 'res/images/pipe_bottom.png', 'res/images/pipe_top.png'],
+}
+
+# Packs the source images of every atlas
+def build_atlases():
+    for name, sources in sorted(ATLAS_SOURCES.items()):
+        Atlas.create(name, sources, ATLAS_SIZE)
+
+# Loads an atlas and uploads its texture, unless it already has been, and returns it.  Needs the
+# window (and so the GL context) to exist.
+def preload(name):
+    atlas = Cache.get('kv.atlas', name)
+    if atlas is None:
+        atlas = Atlas(name + '.atlas')
+        Cache.append('kv.atlas', name, atlas)
+    return atlas
+
+# Returns the texture region of one image in an atlas
+def texture(name, image):
+    return preload(name)[image]
+
+if __name__ == "__main__":
+    build_atlases()
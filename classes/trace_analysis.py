@@ -0,0 +1,164 @@
+# Batch analysis of the recorded strip traces in trials/.  Each trace ('#' comment lines, then
+# "time value" pairs) is parsed in a worker process and cached as a .npz next to the traces, so later
+# runs load the arrays directly instead of parsing text.  The cache is keyed on the trace's size and
+# modification time and rebuilt when either changes.
+# For every trace the strip and sample events are found with the same filter and debouncing as
+# BloodGlucoseTester, and features used to tune READING_DELAY and the thresholds are computed from
+# them: the peak reading, the charge (reading integrated over time) in the reading window and how
+# long the signal takes to settle after the sample goes on.
+# Binary captures (.cap files, see capture.py) can be analysed too.
+# Run from the repository root:  python -m classes.trace_analysis [--jobs 4] [--no-cache] [--csv out.csv] [trace ...]
+
+import os
+import sys
+import glob
+import multiprocessing
+
+import numpy as np
+
+from .adc_backends import load_trace
+from .capture import open_capture, EXTENSION as CAPTURE_EXTENSION
+from .signal_processing import median_filter, Debouncer, SettleDetector
+from .blood_glucose_tester import (STRIP_INSERT_THRESHOLD, SAMPLE_INSERT_THRESHOLD, READING_DELAY, FILTER_WINDOW,
+                                   DEBOUNCE_SAMPLES, SETTLE_WINDOW, SETTLE_TOLERANCE)
+
+TRIALS_DIR = 'trials'
+CACHE_DIR = os.path.join(TRIALS_DIR, '.cache')
+BLOCK_SIZE = 1024
+
+# Features computed for each trace, in the order they are reported.  Times are in seconds from the
+# start of the trace, readings in raw ADC counts; features of events that never happen are nan.
+FEATURES = ('samples', 'duration', 'baseline', 'peak', 'peak_time', 'strip_time', 'sample_time',
+            'reading', 'charge', 'settle_time')
+
+# Returns the path of the cached arrays for a trace
+def cache_path(path, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, os.path.basename(path) + '.npz')
+
+# Loads a trace as (times, values) arrays, from the cache when it is up to date and from the text
+# otherwise (then writing the cache, unless cache_dir is None).  Binary captures are memory mapped
+# directly and never cached.
+def load(path, cache_dir=CACHE_DIR):
+    if path.endswith(CAPTURE_EXTENSION):
+        capture = open_capture(path)
+        return capture.times, capture.values
+    stat = os.stat(path)
+    key = np.array([stat.st_size, stat.st_mtime])
+    if cache_dir is not None:
+        cached = cache_path(path, cache_dir)
+        if os.path.exists(cached):
+            with np.load(cached) as data:
+                if np.array_equal(data['key'], key):
+                    return data['times'], data['values']
+    times, values = load_trace(path)
+    if cache_dir is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write then rename, so a worker killed part way through can't leave a truncated cache
+        temporary = cached + '.tmp.npz'
+        np.savez(temporary, key=key, times=times, values=values.astype(np.int16))
+        os.rename(temporary, cached)
+    return times, values
+
+# Filters values in blocks like the meter does and returns the whole filtered signal
+def filtered(times, values):
+    blocks = ((times[i:i + BLOCK_SIZE], values[i:i + BLOCK_SIZE]) for i in range(0, len(values), BLOCK_SIZE))
+    return np.concatenate([block for t, block in median_filter(blocks, FILTER_WINDOW)] or [np.empty(0)])
+
+# Returns the index of the first debounced crossing of threshold at or after start, or None
+def first_crossing(values, threshold, start=0):
+    found = Debouncer(threshold, DEBOUNCE_SAMPLES).find(values[start:])
+    return None if found is None else start + found
+
+# Integrates values over times (trapezoid rule) between start and end
+def integrate(times, values, start, end):
+    inside = (times >= start) & (times <= end)
+    t, v = times[inside], values[inside].astype(float)
+    if len(t) < 2:
+        return np.nan
+    return float(np.sum((v[1:] + v[:-1]) * np.diff(t)) / 2)
+
+# Computes the FEATURES of one trace, returned as a dict
+def features(times, values, reading_delay=READING_DELAY):
+    result = dict((name, np.nan) for name in FEATURES)
+    result['samples'] = len(values)
+    if not len(values):
+        return result
+    signal = filtered(times, values)
+    result['duration'] = float(times[-1] - times[0])
+    result['baseline'] = float(np.median(signal[times <= times[0] + 1]))
+    peak = int(np.argmax(signal))
+    result['peak'] = float(signal[peak])
+    result['peak_time'] = float(times[peak])
+    strip = first_crossing(signal, STRIP_INSERT_THRESHOLD)
+    if strip is None:
+        return result
+    result['strip_time'] = float(times[strip])
+    sample = first_crossing(signal, SAMPLE_INSERT_THRESHOLD, strip + 1)
+    if sample is None:
+        return result
+    sample_time = times[sample]
+    result['sample_time'] = float(sample_time)
+    reading = int(times.searchsorted(sample_time + reading_delay))
+    if reading < len(times):
+        result['reading'] = float(signal[reading])
+    result['charge'] = integrate(times, values, sample_time, sample_time + reading_delay)
+    settled = SettleDetector(SETTLE_WINDOW, SETTLE_TOLERANCE).find(signal[sample + 1:])
+    if settled is not None:
+        result['settle_time'] = float(times[sample + 1 + settled] - sample_time)
+    return result
+
+# Loads and analyses one trace; the unit of work for the process pool
+def analyse(args):
+    path, cache_dir, reading_delay = args
+    times, values = load(path, cache_dir)
+    return path, features(times, values, reading_delay)
+
+# Analyses every trace in paths with a pool of jobs processes (one per CPU by default) and returns
+# a list of (path, features) in the same order
+def analyse_all(paths, jobs=None, cache_dir=CACHE_DIR, reading_delay=READING_DELAY):
+    work = [(path, cache_dir, reading_delay) for path in paths]
+    if jobs == 1 or len(work) < 2:
+        return [analyse(args) for args in work]
+    if cache_dir is not None and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(analyse, work)
+    finally:
+        pool.close()
+        pool.join()
+
+def format_table(results):
+    lines = ["%-16s" % 'trace' + ''.join("%12s" % name for name in FEATURES)]
+    for path, result in results:
+        lines.append("%-16s" % os.path.basename(path) + ''.join("%12.6g" % result[name] for name in FEATURES))
+    return '\n'.join(lines)
+
+def write_csv(results, out):
+    out.write(','.join(('trace',) + FEATURES) + '\n')
+    for path, result in results:
+        out.write(','.join([os.path.basename(path)] + [repr(float(result[name])) for name in FEATURES]) + '\n')
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    jobs = None
+    cache_dir = CACHE_DIR
+    csv_path = None
+    while args and args[0].startswith('--'):
+        option = args.pop(0)
+        if option == '--jobs' and args:
+            jobs = int(args.pop(0))
+        elif option == '--no-cache':
+            cache_dir = None
+        elif option == '--csv' and args:
+            csv_path = args.pop(0)
+        else:
+            print("usage: python -m classes.trace_analysis [--jobs 4] [--no-cache] [--csv out.csv] [trace ...]")
+            sys.exit(1)
+    paths = args or sorted(glob.glob(os.path.join(TRIALS_DIR, '*.txt')))
+    results = analyse_all(paths, jobs, cache_dir)
+    print(format_table(results))
+    if csv_path is not None:
+        with open(csv_path, 'w') as out:
+            write_csv(results, out)
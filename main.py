@@ -18,36 +18,56 @@ from kivy.uix.widget import Widget
 
 from time import localtime, strftime
 import datetime
+import importlib
 from subprocess import call
 
-from classes.FlappyBird import FlappyBirdApp
-from classes.data_manager import DataManager
-from classes.blood_glucose_tester import BloodGlucoseTester
-from classes.data_screen import DataScreen
-from classes.home_screen import HomeScreen
-from classes.bg_screen import BGScreen
-from classes.settings_screen import SettingsScreen
-from classes.extras_screen import ExtrasScreen
+from classes.data_manager import get_data_manager
+from classes import sprites
 #from classes import settings
 
-homescreen = HomeScreen(name='home')
-datascreen = DataScreen(name='data')
-bgscreen = BGScreen(name='bgtest')
-settingsscreen = SettingsScreen(name='settings')
-extrasscreen = ExtrasScreen(name='extras')
-
+# Every screen, as (name, module, class).  A screen's module (and with it the screen's kv file and
+# whatever heavy libraries it imports) is only imported when the screen is first shown, so startup
+# only pays for the home screen.
+SCREENS = [
+    ('home', 'classes.home_screen', 'HomeScreen'),
+    ('data', 'classes.data_screen', 'DataScreen'),
+    ('bgtest', 'classes.bg_screen', 'BGScreen'),
+    ('settings', 'classes.settings_screen', 'SettingsScreen'),
+    ('extras', 'classes.extras_screen', 'ExtrasScreen'),
+]
+# Screens built PRELOAD_DELAY seconds after startup (once the first frame is up) rather than on first
+# visit.  The BG test screen owns the strip detection, so it has to exist for a strip to be noticed.
+PRELOAD_SCREENS = ['bgtest']
+PRELOAD_DELAY = 0.5
+
+# Adds an entry, or edits the entries with the given Ids.  Editing one entry starts from its values;
+# editing several starts blank, and only the fields filled in are changed on all of them.
 class NewEntryPopup(Popup):
 
-    def __init__(self, **kwargs):
+    def __init__(self, entry_ids=None, **kwargs):
         self.date = datetime.datetime.now()
-        self.dm = DataManager()
+        self.dm = get_data_manager()
+        self.entries = [entry for entry in map(self.dm.get_entry, entry_ids or []) if entry is not None]
+        if len(self.entries) == 1:
+            self.date = self.dm.timestamp_to_date(self.entries[0]['Timestamp'])
         super(NewEntryPopup, self).__init__(**kwargs)
+        if len(self.entries) == 1:
+            self.title = 'Edit Entry'
+            entry = self.entries[0]
+            for field, column in (('bg', 'Bg'), ('carbs', 'Carbs'), ('bolus', 'Bolus')):
+                self.ids[field].text = str(entry[column]) if entry[column] else ''
+            self.ids.notes.text = (entry['Notes'] or '').strip()
+        elif self.entries:
+            self.title = 'Edit %d Entries' % len(self.entries)
 
-    
     def get_date(self):
+        if len(self.entries) > 1:
+            return ''
         return self.date.strftime('%Y-%m-%d')
 
     def get_time(self):
+        if len(self.entries) > 1:
+            return ''
         return self.date.strftime('%H:%M')
 
     def submit(self):
@@ -58,7 +78,18 @@ class NewEntryPopup(Popup):
         carbs = ids.carbs.text
         bolus = ids.bolus.text
         notes = ids.notes.text
-        if time != '' and date != '' and (bg != '' or carbs != '' or bolus != '' or notes != ''):
+        datascreen = App.get_running_app().root.ids.sm.loaded_screen('data')
+        if len(self.entries) > 1:
+            changes = dict((field, value) for field, value in (('bg', bg), ('carbs', carbs), ('bolus', bolus), ('notes', notes))
+                           if value != '')
+            if time != '' and date != '':
+                changes['date'] = date + ' ' + time
+            self.dm.update_entries([entry['Id'] for entry in self.entries], changes)
+            if datascreen is not None:
+                datascreen.clear_selection()
+                datascreen.update_entries(dict((entry['Id'], entry['Timestamp']) for entry in self.entries))
+            self.dismiss()
+        elif time != '' and date != '' and (bg != '' or carbs != '' or bolus != '' or notes != ''):
             if bg == '':
                 bg = 0
             if carbs == '':
@@ -68,8 +99,15 @@ class NewEntryPopup(Popup):
             if notes == '':
                 notes = ' '
             datetime = date + ' ' + time
-            self.dm.new_entry(datetime, bg, carbs, bolus, notes)
-            Clock.schedule_once(datascreen.refresh, 2)
+            if self.entries:
+                entry = self.entries[0]
+                self.dm.update_entry(entry['Id'], datetime, bg, carbs, bolus, notes)
+                if datascreen is not None:
+                    datascreen.update_entries({entry['Id']: entry['Timestamp']})
+            else:
+                entry_id = self.dm.new_entry(datetime, bg, carbs, bolus, notes)
+                if datascreen is not None:  # otherwise the entry shows up when the screen is built
+                    datascreen.add_entry(entry_id)
             self.dismiss()
 
 class CustomScreenManager(ScreenManager):
@@ -80,13 +118,33 @@ class CustomScreenManager(ScreenManager):
     def __init__(self, **kwargs):
 
         super(CustomScreenManager,self).__init__(**kwargs)
-        
-
-        self.add_widget(homescreen)
-        self.add_widget(datascreen)
-        self.add_widget(bgscreen)
-        self.add_widget(settingsscreen)
-        self.add_widget(extrasscreen)
+        self.screen_classes = dict((name, (module, cls)) for name, module, cls in SCREENS)
+
+        self.load_screen('home')
+        Clock.schedule_once(self.preload_screens, PRELOAD_DELAY)
+
+    # Returns the screen called name, importing its module and building it first if need be
+    def load_screen(self, name):
+        screen = self.loaded_screen(name)
+        if screen is None and name in self.screen_classes:
+            module, cls = self.screen_classes[name]
+            screen = getattr(importlib.import_module(module), cls)(name=name)
+            self.add_widget(screen)
+        return screen
+
+    # Returns the screen called name if it has been built, or None
+    def loaded_screen(self, name):
+        if self.has_screen(name):
+            return self.get_screen(name)
+        return None
+
+    def preload_screens(self, dt):
+        for name in PRELOAD_SCREENS:
+            self.load_screen(name)
+
+    def on_current(self, instance, value):
+        self.load_screen(value)
+        super(CustomScreenManager, self).on_current(instance, value)
 
 class Glucometer(App):
 
@@ -105,10 +163,17 @@ class Glucometer(App):
     def build(self):
         self.root.ids.spnr.text = "Home"
 
+    def on_stop(self):
+        # commit writes still waiting for the commit window and checkpoint the log
+        get_data_manager().close()
+
     def refresh_data_screen(self):
-        datascreen.refresh()
+        datascreen = self.root.ids.sm.loaded_screen('data')
+        if datascreen is not None:
+            datascreen.refresh()
 
     def flappy(self):
+        from classes.FlappyBird import FlappyBirdApp
         FlappyBirdApp().run()
 
     def set_previous(self, screen_id):
@@ -141,8 +206,8 @@ class Glucometer(App):
                 sm.current = self.screen_ids[i]
                 self.set_previous(self.screen_ids[i])
                 break;
-    def open_new_entry_popup(self):
-        popup = NewEntryPopup()
+    def open_new_entry_popup(self, entry_ids=None):
+        popup = NewEntryPopup(entry_ids)
         popup.open()
     def on_pause(self):
         return True
@@ -184,4 +249,6 @@ class MyKeyboardListener(Widget):
         # the system.
         return True
 
+# upload the UI images before the kv files ask for them
+sprites.preload(sprites.UI_ATLAS)
 Glucometer().run()
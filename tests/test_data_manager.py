@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from classes.data_manager import DataManager
+
+
+class DataManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dm = DataManager(os.path.join(self.directory, 'data.db'), storage='rollback')
+
+    def tearDown(self):
+        self.dm.close()
+        shutil.rmtree(self.directory)
+
+
+class GetStatsTest(DataManagerTestCase):
+    def test_stats_of_nonzero_values(self):
+        self.dm.new_entries([('2024-05-01 08:00', 100, 40, 2.0, ''),
+                             ('2024-05-01 12:00', 140, 0, 0, ''),
+                             ('2024-05-02 08:00', 0, 60, 4.0, '')])
+        stats = self.dm.get_stats('2024-05-01', '2024-05-02')
+        self.assertEqual(stats['Days'], 2)
+        self.assertEqual(stats['Entries'], 3)
+        self.assertEqual(stats['Bg']['count'], 2)
+        self.assertAlmostEqual(stats['Bg']['mean'], 120.0)
+        self.assertAlmostEqual(stats['Bg']['std'], 20.0)
+        self.assertEqual(stats['Carbs']['count'], 2)
+        self.assertAlmostEqual(stats['Carbs']['sum'], 100.0)
+        self.assertAlmostEqual(stats['Bolus']['mean'], 3.0)
+
+    def test_edits_and_deletes_update_the_stats(self):
+        first = self.dm.new_entry('2024-05-01 08:00', 100, 0, 0, '')
+        second = self.dm.new_entry('2024-05-01 09:00', 200, 0, 0, '')
+        self.dm.update_entry(first, '2024-05-01 08:00', 120, 0, 0, '')
+        self.dm.delete_entry(second)
+        stats = self.dm.get_stats('2024-05-01', '2024-05-01')
+        self.assertEqual(stats['Entries'], 1)
+        self.assertEqual(stats['Bg']['count'], 1)
+        self.assertAlmostEqual(stats['Bg']['mean'], 120.0)
+        self.assertAlmostEqual(stats['Bg']['std'], 0.0)
+
+    def test_empty_range(self):
+        stats = self.dm.get_stats('2024-05-01', '2024-05-31')
+        self.assertEqual(stats['Days'], 0)
+        self.assertEqual(stats['Entries'], 0)
+        self.assertEqual(stats['Bg'], {'count': 0, 'sum': 0.0, 'mean': 0.0, 'std': 0.0})
+
+
+if __name__ == '__main__':
+    unittest.main()